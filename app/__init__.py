@@ -4,6 +4,11 @@ from flask_login import LoginManager
 from flask_bcrypt import Bcrypt
 import os
 from dotenv import load_dotenv
+from app.nlp.index import JobIndex, ResumeIndex
+from app.nlp.ann import ANNIndex
+from app.tasks import ParseQueue
+from app.cache import RankingCache
+from app.nlp.scoring import DEFAULT_WEIGHTS, ResumeFeatureStore, parse_weights
 
 # Load environment variables
 load_dotenv()
@@ -12,6 +17,12 @@ load_dotenv()
 mongo = PyMongo()
 login_manager = LoginManager()
 bcrypt = Bcrypt()
+resume_index = ResumeIndex()
+job_index = JobIndex()
+ann_index = ANNIndex()
+resume_features = ResumeFeatureStore()
+parse_queue = ParseQueue()
+ranking_cache = RankingCache()
 
 def create_app(config_class=None):
     app = Flask(__name__)
@@ -21,6 +32,40 @@ def create_app(config_class=None):
     app.config["MONGO_URI"] = os.environ.get("MONGO_URI", "mongodb://localhost:27017/smart_hire")
     app.config["UPLOAD_FOLDER"] = os.path.join(app.root_path, "uploads")
     app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB max upload
+    app.config["PARSER_FAST_MODE"] = os.environ.get("PARSER_FAST_MODE", "false").lower() in ("1", "true", "yes")
+    app.config["SPACY_PRELOAD"] = [name for name in os.environ.get("SPACY_PRELOAD", "").split(",") if name]
+    app.config["PARSE_WORKERS"] = int(os.environ.get("PARSE_WORKERS", 2))
+    app.config["PARSE_ISOLATION"] = os.environ.get("PARSE_ISOLATION", "true").lower() in ("1", "true", "yes")
+    app.config["PARSE_STALE_AFTER"] = int(os.environ.get("PARSE_STALE_AFTER", 600))
+    app.config["PARSE_CACHE_TTL"] = int(os.environ.get("PARSE_CACHE_TTL", 30 * 24 * 3600))
+    app.config["PARSE_TIMEOUT"] = int(os.environ.get("PARSE_TIMEOUT", 60))
+    app.config["PARSE_CPU_LIMIT"] = int(os.environ.get("PARSE_CPU_LIMIT", 30))
+    app.config["PARSE_MEMORY_LIMIT_MB"] = int(os.environ.get("PARSE_MEMORY_LIMIT_MB", 2048))
+    app.config["PARSE_MAX_TASKS_PER_CHILD"] = int(os.environ.get("PARSE_MAX_TASKS_PER_CHILD", 50))
+    app.config["RANKING_CACHE_SIZE"] = int(os.environ.get("RANKING_CACHE_SIZE", 256))
+    app.config["RANKING_CACHE_BYTES"] = int(os.environ.get("RANKING_CACHE_MB", 256)) * 1024 * 1024
+    app.config["RESUME_MATCH_CACHE_SIZE"] = int(os.environ.get("RESUME_MATCH_CACHE_SIZE", 4096))
+    app.config["RANKING_CACHE_DIR"] = os.environ.get("RANKING_CACHE_DIR")
+    app.config["RANKING_CACHE_DISK_BYTES"] = int(os.environ.get("RANKING_CACHE_DISK_MB", 1024)) * 1024 * 1024
+    app.config["RANKING_CACHE_TTL"] = int(os.environ.get("RANKING_CACHE_TTL", 86400))
+    app.config["RESUME_INDEX_DIR"] = os.environ.get("RESUME_INDEX_DIR", os.path.join(app.root_path, "nlp", "models", "index"))
+    app.config["VECTOR_STORAGE_FORMAT"] = os.environ.get("VECTOR_STORAGE_FORMAT", "sparse")
+    app.config["VECTORIZER_METHOD"] = os.environ.get("VECTORIZER_METHOD", "tfidf")
+    app.config["RESUME_INDEX_SYNC_INTERVAL"] = int(os.environ.get("RESUME_INDEX_SYNC_INTERVAL", 30))
+    app.config["RESUME_INDEX_SYNC_OVERLAP"] = int(os.environ.get("RESUME_INDEX_SYNC_OVERLAP", 120))
+    app.config["RESUME_INDEX_PRUNE_INTERVAL"] = int(os.environ.get("RESUME_INDEX_PRUNE_INTERVAL", 300))
+    app.config["HYBRID_WEIGHTS"] = parse_weights(os.environ["HYBRID_WEIGHTS"]) if os.environ.get("HYBRID_WEIGHTS") else dict(DEFAULT_WEIGHTS)
+    app.config["SHORTLIST_SIZE"] = int(os.environ.get("SHORTLIST_SIZE", 0))
+    app.config["SHORTLIST_AUDIT_RATE"] = float(os.environ.get("SHORTLIST_AUDIT_RATE", 0.0))
+    app.config["SHORTLIST_AUDIT_K"] = int(os.environ.get("SHORTLIST_AUDIT_K", 50))
+    app.config["MATCHING_JOBS_LIMIT"] = int(os.environ.get("MATCHING_JOBS_LIMIT", 5))
+    app.config["ANN_VECTOR_MODEL"] = os.environ.get("ANN_VECTOR_MODEL", "spacy:en_core_web_md")
+    app.config["ANN_ENABLED"] = os.environ.get("ANN_ENABLED", "false").lower() in ("1", "true", "yes")
+    app.config["ANN_BACKEND"] = os.environ.get("ANN_BACKEND", "auto")
+    app.config["ANN_INDEX_DIR"] = os.environ.get("ANN_INDEX_DIR", os.path.join(app.root_path, "nlp", "models", "ann"))
+    app.config["ANN_CANDIDATES"] = int(os.environ.get("ANN_CANDIDATES", 1000))
+    app.config["ANN_SEARCH_EFFORT"] = int(os.environ["ANN_SEARCH_EFFORT"]) if os.environ.get("ANN_SEARCH_EFFORT") else None
+    app.config["ANN_NLIST"] = int(os.environ["ANN_NLIST"]) if os.environ.get("ANN_NLIST") else None
     
     # Ensure upload directory exists
     os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
@@ -31,6 +76,12 @@ def create_app(config_class=None):
     login_manager.login_view = "auth.login"
     login_manager.login_message_category = "info"
     bcrypt.init_app(app)
+    resume_index.init_app(app)
+    job_index.init_app(app)
+    ann_index.init_app(app)
+    resume_features.init_app(app)
+    parse_queue.init_app(app)
+    ranking_cache.init_app(app)
     
     # Register blueprints
     from app.routes.auth import auth
@@ -43,4 +94,13 @@ def create_app(config_class=None):
     app.register_blueprint(applicant)
     app.register_blueprint(recruiter)
     
+    # Load spaCy models before workers fork (e.g. under gunicorn --preload)
+    if app.config["SPACY_PRELOAD"]:
+        from app.nlp.registry import preload_models
+        preload_models(app.config["SPACY_PRELOAD"])
+    
+    # Register CLI commands
+    from app.cli import register_commands
+    register_commands(app)
+    
     return app
@@ -0,0 +1,281 @@
+import hashlib
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+class TTLCache:
+    """Small thread-safe mapping whose entries expire after ``ttl`` seconds"""
+    
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get_many(self, keys):
+        """Return a dict of the keys that are cached and still fresh"""
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is None:
+                    continue
+                expires, value = entry
+                if expires < now:
+                    del self._data[key]
+                    continue
+                found[key] = value
+        return found
+    
+    def set_many(self, items):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for key, value in items.items():
+                self._data[key] = (expires, value)
+                self._data.move_to_end(key)
+            # Evict the oldest entries once we grow past the bound
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+def ranking_nbytes(value):
+    """Approximate memory held by a cached ranking: array buffers plus list items"""
+    if isinstance(value, tuple):
+        return sum(ranking_nbytes(part) for part in value)
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if isinstance(value, list):
+        return sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value)
+    return sys.getsizeof(value)
+
+class LRUCache:
+    """Thread-safe least-recently-used cache that counts hits and misses.
+
+    Bounded by entry count and, when ``maxbytes`` is set, by the total of
+    ``sizeof(value)`` over the cached values.
+    """
+    
+    def __init__(self, maxsize=256, maxbytes=None, sizeof=ranking_nbytes):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key][0]
+            self.misses += 1
+            return default
+    
+    def set(self, key, value):
+        size = self.sizeof(value) if self.maxbytes is not None else 0
+        if self.maxbytes is not None and size > self.maxbytes:
+            # Would evict everything else and still not fit
+            return
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous[1]
+            self._data[key] = (value, size)
+            self.nbytes += size
+            while len(self._data) > self.maxsize or (self.maxbytes is not None and self.nbytes > self.maxbytes):
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.nbytes -= evicted_size
+    
+    def invalidate(self, predicate):
+        """Drop every entry whose key matches the predicate"""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                self.nbytes -= self._data.pop(key)[1]
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+    
+    def stats(self):
+        return {
+            'size': len(self._data), 'maxsize': self.maxsize, 'bytes': self.nbytes,
+            'maxbytes': self.maxbytes, 'hits': self.hits, 'misses': self.misses
+        }
+
+class DiskCache:
+    """Pickle-per-entry cache directory, shared by every process on the host.
+
+    Entries older than ``ttl`` seconds are ignored and removed, and once the
+    directory holds more than ``max_bytes`` the oldest entries are deleted.
+    Pruning scans the directory, so it runs at most every ``prune_interval``
+    seconds per process.
+    """
+    
+    def __init__(self, directory, max_bytes=None, ttl=None, prune_interval=60):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        self._last_prune = 0.0
+        self._prune_lock = threading.Lock()
+    
+    def _path(self, namespace, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return self.directory / f'{namespace}-{digest}.pkl'
+    
+    def get(self, namespace, key, default=None):
+        path = self._path(namespace, key)
+        try:
+            if self.ttl and time.time() - path.stat().st_mtime > self.ttl:
+                path.unlink()
+                return default
+            with open(path, 'rb') as f:
+                stored_key, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return default
+        return value if stored_key == key else default
+    
+    def set(self, namespace, key, value):
+        path = self._path(namespace, key)
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        
+        now = time.monotonic()
+        if now - self._last_prune >= self.prune_interval and self._prune_lock.acquire(blocking=False):
+            try:
+                self._last_prune = now
+                self.prune()
+            finally:
+                self._prune_lock.release()
+    
+    def prune(self):
+        """Delete expired entries, then the oldest ones until the directory fits ``max_bytes``"""
+        if not self.ttl and self.max_bytes is None:
+            return
+        
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if not entry.name.endswith('.pkl'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        
+        expired_before = time.time() - self.ttl if self.ttl else None
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            expired = expired_before is not None and mtime < expired_before
+            if not expired and (self.max_bytes is None or total <= self.max_bytes):
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+    
+    def invalidate(self, namespace):
+        for path in self.directory.glob(f'{namespace}-*.pkl'):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+class RankingCache:
+    """Cache of ranking results keyed by job, vector model and resume generation.
+
+    Results live in an in-process LRU and, when ``RANKING_CACHE_DIR`` is
+    set, also on disk so other workers can reuse them. Any change to the
+    resume collection bumps its generation, which makes older entries
+    unreachable; editing a job description drops that job's entries.
+    Rankings of jobs for a resume are much smaller and far more numerous,
+    so they get their own LRU instead of pushing job rankings out.
+    """
+    
+    def __init__(self, app=None):
+        self.jobs = LRUCache()
+        self.resumes = LRUCache()
+        self.disk = None
+        self.disk_hits = 0
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.jobs = LRUCache(
+            maxsize=app.config.get('RANKING_CACHE_SIZE', 256),
+            maxbytes=app.config.get('RANKING_CACHE_BYTES')
+        )
+        self.resumes = LRUCache(maxsize=app.config.get('RESUME_MATCH_CACHE_SIZE', 4096))
+        if app.config.get('RANKING_CACHE_DIR'):
+            self.disk = DiskCache(
+                app.config['RANKING_CACHE_DIR'],
+                max_bytes=app.config.get('RANKING_CACHE_DISK_BYTES'),
+                ttl=app.config.get('RANKING_CACHE_TTL')
+            )
+        app.extensions['ranking_cache'] = self
+    
+    def _get(self, memory, namespace, key):
+        value = memory.get((namespace, key))
+        if value is None and self.disk is not None:
+            value = self.disk.get(namespace, key)
+            if value is not None:
+                self.disk_hits += 1
+                memory.set((namespace, key), value)
+        return value
+    
+    def _set(self, memory, namespace, key, value):
+        memory.set((namespace, key), value)
+        if self.disk is not None:
+            self.disk.set(namespace, key, value)
+    
+    def get_job(self, job_id, key):
+        """The cached ranking of resumes for a job, or None"""
+        return self._get(self.jobs, job_id, key)
+    
+    def set_job(self, job_id, key, value):
+        self._set(self.jobs, job_id, key, value)
+    
+    def get_resume(self, resume_id, key):
+        """The cached ranking of jobs for a resume, or None"""
+        return self._get(self.resumes, f'resume-{resume_id}', key)
+    
+    def set_resume(self, resume_id, key, value):
+        self._set(self.resumes, f'resume-{resume_id}', key, value)
+    
+    def invalidate_job(self, job_id):
+        """Forget every cached ranking for a job description"""
+        self.jobs.invalidate(lambda cached_key: cached_key[0] == job_id)
+        if self.disk is not None:
+            self.disk.invalidate(job_id)
+    
+    def clear(self):
+        self.jobs.clear()
+        self.resumes.clear()
+    
+    def stats(self):
+        stats = self.jobs.stats()
+        stats['resumes'] = self.resumes.stats()
+        stats['disk_hits'] = self.disk_hits
+        return stats
@@ -0,0 +1,400 @@
+import multiprocessing
+import os
+import time
+from pathlib import Path
+
+import click
+import numpy as np
+from flask.cli import AppGroup
+from scipy import sparse
+from pymongo import UpdateOne
+from app import ann_index, job_index, mongo, resume_index
+from app.nlp.storage import VECTOR_FORMATS, configured_format, decode_vector, encode_vector, stored_datetime, vector_format
+
+index_cli = AppGroup('resume-index', help='Manage the in-process resume vector index.')
+
+@index_cli.command('rebuild')
+@click.option('--batch-size', default=1000, show_default=True, help='MongoDB cursor batch size.')
+def rebuild_resume_index(batch_size):
+    """Rebuild the resume vector index from MongoDB and write a snapshot"""
+    resume_index.rebuild(batch_size=batch_size)
+    resume_index.save_snapshot(force=True)
+    click.echo(f'Indexed {len(resume_index)} resumes (dimension {resume_index.dimension}).')
+
+job_index_cli = AppGroup('job-index', help='Manage the in-process job description vector index.')
+
+@job_index_cli.command('rebuild')
+@click.option('--batch-size', default=1000, show_default=True, help='MongoDB cursor batch size.')
+def rebuild_job_index(batch_size):
+    """Rebuild the job description vector index from MongoDB and write a snapshot"""
+    job_index.rebuild(batch_size=batch_size)
+    job_index.save_snapshot(force=True)
+    click.echo(f'Indexed {len(job_index)} job descriptions (dimension {job_index.dimension}).')
+
+ann_cli = AppGroup('ann-index', help='Manage the approximate nearest-neighbour index for dense embeddings.')
+
+@ann_cli.command('build')
+def build_ann_index():
+    """Build the ANN index from the stored resume vectors and persist it"""
+    ann_index.build_from(resume_index)
+    if ann_index.index is None:
+        raise click.ClickException(f'No resumes vectorized with {ann_index.vector_model} to index.')
+    ann_index.save(force=True)
+    click.echo(f'Indexed {len(ann_index.index)} resumes with the {ann_index.backend_name()} backend.')
+
+@click.command('benchmark-ann')
+@click.option('--k', default=10, show_default=True, help='Neighbours compared per query.')
+@click.option('--queries', default=200, show_default=True, help='Resume vectors sampled as queries.')
+@click.option('--effort', 'efforts', default='1,4,16,64', show_default=True,
+              help='Comma-separated search efforts (IVF probes or HNSW ef) to measure.')
+def benchmark_ann(k, queries, efforts):
+    """Measure recall@k and latency of the ANN index against exact brute force"""
+    matrix = resume_index.matrix()
+    rows = matrix.rows_for_version(ann_index.vector_model)
+    if not len(rows):
+        raise click.ClickException(f'No resumes vectorized with {ann_index.vector_model} to benchmark.')
+    
+    # Benchmark a separate in-memory index, so the live one is left untouched
+    # and the benchmark does not depend on ANN_ENABLED
+    vectors = matrix.matrix[rows]
+    if sparse.issparse(vectors):
+        vectors = vectors.toarray()
+    bench_index = ann_index.scratch()
+    bench_index.build([matrix.ids[i] for i in rows], vectors)
+    rng = np.random.default_rng(0)
+    sample = vectors[rng.choice(len(rows), size=min(queries, len(rows)), replace=False)]
+    
+    started = time.perf_counter()
+    exact = [set(matrix.top_k(query, k, version=ann_index.vector_model)[0]) for query in sample]
+    exact_ms = (time.perf_counter() - started) / len(sample) * 1000
+    click.echo(f'{len(rows)} vectors, {len(sample)} queries, {bench_index.backend_name()} backend')
+    click.echo(f'{"brute force":<14} recall@{k} 1.000 {exact_ms:8.2f} ms/query')
+    
+    for effort in (int(value) for value in efforts.split(',')):
+        started = time.perf_counter()
+        found = [set(bench_index.search(query, k, effort=effort)[0]) for query in sample]
+        per_query = (time.perf_counter() - started) / len(sample) * 1000
+        recall = np.mean([len(a & e) / len(e) for a, e in zip(found, exact) if e])
+        click.echo(f'{"effort " + str(effort):<14} recall@{k} {recall:.3f} {per_query:8.2f} ms/query')
+
+@click.command('benchmark-shortlist')
+@click.option('--shortlist-size', 'sizes', default='200,500,1000', show_default=True,
+              help='Comma-separated shortlist sizes to measure.')
+@click.option('--k', default=50, show_default=True, help='Top results compared with the full ranking.')
+@click.option('--jobs', default=100, show_default=True, help='Job descriptions used as queries.')
+def benchmark_shortlist(sizes, k, jobs):
+    """Measure recall@k and latency of two-stage retrieval against full ranking"""
+    from app.models.job_description import JobDescription
+    from app.nlp.ranker import ResumeRanker
+    
+    jd_ids = [str(document['_id']) for document in mongo.db.job_descriptions.find(
+        {'vector': {'$ne': None}}, {'_id': 1}
+    ).limit(jobs)]
+    jds = [JobDescription.get_by_id(jd_id, ResumeRanker.JD_RANKING_PROJECTION) for jd_id in jd_ids]
+    jds = [jd for jd in jds if jd and len(jd.vector) == resume_index.dimension]
+    if not jds:
+        raise click.ClickException('No job descriptions comparable with the resume index.')
+    
+    ranker = ResumeRanker()
+    resume_index.term_postings()  # built up front so it is not part of the timings
+    
+    started = time.perf_counter()
+    full = [ranker._similarity_order(jd, k)[0] for jd in jds]
+    full_ms = (time.perf_counter() - started) / len(jds) * 1000
+    click.echo(f'{len(resume_index)} resumes, {len(jds)} jobs')
+    click.echo(f'{"full ranking":<16} recall@{k} 1.000 {full_ms:8.2f} ms/job')
+    
+    for size in (int(value) for value in sizes.split(',')):
+        started = time.perf_counter()
+        shortlisted = [ranker._shortlisted_order(jd, size)[0][:k] for jd in jds]
+        per_job = (time.perf_counter() - started) / len(jds) * 1000
+        recalls = [len(set(s) & set(f)) / len(f) for s, f in zip(shortlisted, full) if f]
+        recall = sum(recalls) / len(recalls) if recalls else 0.0
+        click.echo(f'{"shortlist " + str(size):<16} recall@{k} {recall:.3f} {per_job:8.2f} ms/job')
+
+@click.command('migrate-vectors')
+@click.option('--format', 'fmt', type=click.Choice(VECTOR_FORMATS), default=None,
+              help='Target storage format (defaults to VECTOR_STORAGE_FORMAT).')
+@click.option('--batch-size', default=500, show_default=True, help='Documents per bulk write.')
+def migrate_vectors(fmt, batch_size):
+    """Rewrite stored resume and job description vectors in another format"""
+    fmt = fmt or configured_format()
+    
+    for collection in (mongo.db.resumes, mongo.db.job_descriptions):
+        converted = 0
+        operations = []
+        cursor = collection.find({'vector': {'$ne': None}}, {'vector': 1}).batch_size(batch_size)
+        for document in cursor:
+            if vector_format(document['vector']) == fmt:
+                continue
+            vector = encode_vector(decode_vector(document['vector']), fmt)
+            operations.append(UpdateOne({'_id': document['_id']}, {'$set': {'vector': vector}}))
+            if len(operations) >= batch_size:
+                converted += collection.bulk_write(operations, ordered=False).modified_count
+                operations = []
+        if operations:
+            converted += collection.bulk_write(operations, ordered=False).modified_count
+        click.echo(f'{collection.name}: converted {converted} vectors to {fmt}.')
+
+@click.command('backfill-skill-keys')
+@click.option('--batch-size', default=500, show_default=True, help='Documents per bulk write.')
+def backfill_skill_keys(batch_size):
+    """Store normalized skill keys on documents parsed before they existed"""
+    from app.nlp.skills import normalize_skills
+    
+    for collection in (mongo.db.resumes, mongo.db.job_descriptions):
+        updated = 0
+        operations = []
+        cursor = collection.find(
+            {'parsed_data': {'$ne': None}, 'parsed_data.skill_keys': {'$exists': False}},
+            {'parsed_data.skills': 1}
+        ).batch_size(batch_size)
+        for document in cursor:
+            keys = normalize_skills(document['parsed_data'].get('skills', []))
+            operations.append(UpdateOne({'_id': document['_id']}, {'$set': {'parsed_data.skill_keys': keys}}))
+            if len(operations) >= batch_size:
+                updated += collection.bulk_write(operations, ordered=False).modified_count
+                operations = []
+        if operations:
+            updated += collection.bulk_write(operations, ordered=False).modified_count
+        click.echo(f'{collection.name}: stored skill keys on {updated} documents.')
+
+@click.command('requeue-stale-resumes')
+def requeue_stale_resumes():
+    """Parse again resumes left 'processing' by a restarted web process"""
+    from flask import current_app
+    from app import parse_queue
+    
+    app = current_app._get_current_object()
+    recovered = parse_queue.recover_stale(app)
+    # Wait for the requeued jobs, which run in this process
+    parse_queue.shutdown(wait=True)
+    click.echo(f'Recovered {recovered} stale resumes.')
+
+def _extract_text(file_path):
+    """Pool worker: extract text from one file, returning ``(path, text, error)``"""
+    from app.nlp.parser import extract_text_from_file
+    
+    try:
+        return file_path, extract_text_from_file(file_path), None
+    except Exception as e:
+        return file_path, None, str(e)
+
+@click.command('ingest-resumes')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--chunk-size', default=200, show_default=True, help='Files extracted, parsed and written per round.')
+@click.option('--batch-size', default=50, show_default=True, help='Documents per spaCy nlp.pipe batch.')
+@click.option('--n-process', default=1, show_default=True, help='spaCy worker processes.')
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True, help='Processes used for text extraction.')
+@click.option('--restart', is_flag=True, help='Re-ingest files that were already imported.')
+@click.option('--fast', is_flag=True, help='Skip the dependency parser (see PARSER_FAST_MODE).')
+def ingest_resumes(directory, chunk_size, batch_size, n_process, workers, restart, fast):
+    """Bulk import PDF and DOCX resumes from a directory"""
+    from app.models.resume import Resume
+    from app.nlp.parser import parse_resume_texts
+    from app.nlp.vectorizer import get_vectorizer
+    
+    paths = sorted(
+        str(path.resolve()) for path in Path(directory).rglob('*')
+        if path.suffix.lower() in ('.pdf', '.docx')
+    )
+    
+    # Files are tagged with their source path, so an interrupted run
+    # picks up after the last chunk that was written
+    mongo.db.resumes.create_index('source_file', sparse=True)
+    done = set() if restart else set(mongo.db.resumes.distinct('source_file', {'source_file': {'$ne': None}}))
+    pending = [path for path in paths if path not in done]
+    click.echo(f'{len(paths)} files found, {len(paths) - len(pending)} already ingested, {len(pending)} to go.')
+    
+    vectorizer = get_vectorizer()
+    ingested = failed = 0
+    started = time.perf_counter()
+    
+    with multiprocessing.Pool(workers) as pool:
+        for start in range(0, len(pending), chunk_size):
+            extracted = pool.map(_extract_text, pending[start:start + chunk_size])
+            
+            sources, texts = [], []
+            for path, text, error in extracted:
+                if error is not None:
+                    failed += 1
+                    click.echo(f'Skipping {path}: {error}', err=True)
+                    continue
+                sources.append(path)
+                texts.append(text)
+            
+            parsed = list(parse_resume_texts(texts, batch_size=batch_size, n_process=n_process, fast=fast))
+            vectors, vector_model = vectorizer.vectorize_many(parsed)
+            
+            resumes = []
+            for path, parsed_data, vector in zip(sources, parsed, vectors):
+                resume = Resume()
+                resume.filename = os.path.basename(path)
+                resume.source_file = path
+                resume.parsed_data = parsed_data
+                resume.vector = vector
+                resume.vector_model = vector_model
+                resume.status = 'ready'
+                resumes.append(resume)
+            Resume.insert_many(resumes)
+            
+            ingested += len(resumes)
+            elapsed = time.perf_counter() - started
+            click.echo(f'{ingested}/{len(pending)} ingested, {failed} failed ({ingested / elapsed:.1f} docs/sec)')
+    
+    resume_index.save_snapshot()
+    elapsed = time.perf_counter() - started
+    rate = ingested / elapsed if elapsed else 0.0
+    click.echo(f'Done: {ingested} resumes in {elapsed:.1f}s ({rate:.1f} docs/sec), {failed} failed.')
+
+def _iter_corpus_texts(vectorizer, batch_size):
+    """Stream the combined text of every stored resume and job description"""
+    for collection in (mongo.db.resumes, mongo.db.job_descriptions):
+        cursor = collection.find({}, {'parsed_data': 1}).batch_size(batch_size)
+        for document in cursor:
+            yield vectorizer.document_text(document.get('parsed_data') or {})
+
+def _revectorize_collection(collection, vectorizer, batch_size):
+    """Re-vectorize every document in a collection in batches, returning the count"""
+    updated = 0
+    ids, batch = [], []
+    
+    def flush():
+        now = stored_datetime()
+        vectors, vector_model = vectorizer.vectorize_many(batch)
+        operations = [
+            UpdateOne({'_id': document_id}, {'$set': {
+                'vector': encode_vector(vector),
+                'vector_model': vector_model,
+                'updated_at': now
+            }})
+            for document_id, vector in zip(ids, vectors)
+        ]
+        return collection.bulk_write(operations, ordered=False).modified_count
+    
+    cursor = collection.find({'parsed_data': {'$ne': None}}, {'parsed_data': 1}).batch_size(batch_size)
+    for document in cursor:
+        ids.append(document['_id'])
+        batch.append(document['parsed_data'])
+        if len(batch) >= batch_size:
+            updated += flush()
+            ids, batch = [], []
+    if batch:
+        updated += flush()
+    return updated
+
+@click.command('fit-vectorizer')
+@click.option('--max-features', default=5000, show_default=True, help='TF-IDF vocabulary size.')
+@click.option('--batch-size', default=500, show_default=True, help='Documents per read and bulk write.')
+@click.option('--no-revectorize', is_flag=True, help='Only fit and activate the model.')
+def fit_vectorizer(max_features, batch_size, no_revectorize):
+    """Fit the TF-IDF model on all resumes and job descriptions"""
+    from app.models.job_description import JobDescription
+    from app.models.resume import Resume
+    from app.nlp.vectorizer import get_vectorizer, new_tfidf_model, save_tfidf_model
+    
+    vectorizer = get_vectorizer()
+    if vectorizer.method != 'tfidf':
+        raise click.ClickException(f'VECTORIZER_METHOD is {vectorizer.method!r}; only TF-IDF models are fitted.')
+    model = new_tfidf_model(max_features=max_features)
+    
+    started = time.perf_counter()
+    try:
+        model.fit(_iter_corpus_texts(vectorizer, batch_size))
+    except ValueError as e:
+        # Raised by scikit-learn when the corpus is empty
+        raise click.ClickException(f'Could not fit the TF-IDF model: {e}')
+    version = save_tfidf_model(model)
+    click.echo(f'Fitted TF-IDF model {version} with {len(model.vocabulary_)} terms '
+               f'in {time.perf_counter() - started:.1f}s.')
+    
+    if no_revectorize:
+        return
+    
+    # The shared vectorizer picks up the newly activated version by itself
+    for collection in (mongo.db.resumes, mongo.db.job_descriptions):
+        updated = _revectorize_collection(collection, vectorizer, batch_size)
+        click.echo(f'{collection.name}: re-vectorized {updated} documents with {vectorizer.model_version}.')
+    Resume.bump_generation()
+    JobDescription.bump_generation()
+    
+    for index in (resume_index, job_index):
+        index.rebuild()
+        index.save_snapshot(force=True)
+
+@click.command('benchmark-parser')
+@click.argument('files', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--repeat', default=5, show_default=True, help='Timed passes over the files per mode.')
+def benchmark_parser(files, repeat):
+    """Compare per-document parse latency of the spaCy pipeline modes"""
+    from app.nlp import parser
+    
+    texts = [parser.extract_text_from_file(path) for path in files]
+    sections = [parser.segment_sections(text) for text in texts]
+    modes = [
+        ('full pipeline', lambda text, text_sections: parser.nlp(text)),
+        ('task-specific', lambda text, text_sections: parser.process_text(text)),
+        ('sectioned', lambda text, text_sections: parser.process_text(parser.nlp_input(text, text_sections))),
+        ('fast mode', lambda text, text_sections: parser.process_text(parser.nlp_input(text, text_sections), fast=True)),
+    ]
+    
+    for name, run in modes:
+        # Warm up once so lazy loading is not part of the measurement
+        tokens = 0
+        for text, text_sections in zip(texts, sections):
+            doc = run(text, text_sections)
+            tokens += len(doc)
+            parser.build_resume_data(text, doc, text_sections)
+        
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for text, text_sections in zip(texts, sections):
+                parser.build_resume_data(text, run(text, text_sections), text_sections)
+        per_doc = (time.perf_counter() - started) / (repeat * len(texts)) * 1000
+        click.echo(f'{name:<15} {per_doc:8.1f} ms/doc {tokens / len(texts):8.0f} spaCy tokens/doc')
+    
+    segmented = sum(text_sections is not None for text_sections in sections)
+    click.echo(f'{segmented}/{len(texts)} documents split into sections')
+
+@click.command('benchmark-extraction')
+@click.argument('files', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--repeat', default=3, show_default=True, help='Timed passes over the files per mode.')
+def benchmark_extraction(files, repeat):
+    """Time and peak memory of PDF/DOCX text extraction with and without budgets"""
+    import tracemalloc
+    from app.nlp import parser
+    
+    modes = [
+        ('unbounded', {'max_pages': 0, 'max_chars': 0}),
+        (f'budgeted ({parser.MAX_PAGES} pages, {parser.MAX_CHARS} chars)', {}),
+    ]
+    for name, budget in modes:
+        for path in files:
+            started = time.perf_counter()
+            for _ in range(repeat):
+                text = parser.extract_text_from_file(path, **budget)
+            per_doc = (time.perf_counter() - started) / repeat * 1000
+            
+            # Measured in a separate pass, since tracing slows allocation down
+            tracemalloc.start()
+            parser.extract_text_from_file(path, **budget)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            
+            click.echo(f'{name:<40} {os.path.basename(path):<30} {per_doc:8.1f} ms/doc '
+                       f'{peak / 1024 / 1024:7.1f} MiB peak {len(text):>9} chars')
+
+def register_commands(app):
+    """Attach the project's CLI commands to the Flask app"""
+    app.cli.add_command(index_cli)
+    app.cli.add_command(job_index_cli)
+    app.cli.add_command(ann_cli)
+    app.cli.add_command(benchmark_ann)
+    app.cli.add_command(benchmark_shortlist)
+    app.cli.add_command(migrate_vectors)
+    app.cli.add_command(backfill_skill_keys)
+    app.cli.add_command(requeue_stale_resumes)
+    app.cli.add_command(ingest_resumes)
+    app.cli.add_command(benchmark_parser)
+    app.cli.add_command(benchmark_extraction)
+    app.cli.add_command(fit_vectorizer)
@@ -0,0 +1,39 @@
+import hashlib
+import os
+import tempfile
+
+CHUNK_SIZE = 1024 * 1024
+
+def content_path(folder, content_hash, extension):
+    """Where ``save_content_addressed`` keeps the file with this content hash"""
+    return os.path.join(folder, content_hash[:2], content_hash + extension.lower())
+
+def save_content_addressed(stream, folder, extension):
+    """Store an uploaded file under the SHA-256 of its content.
+
+    Returns ``(content_hash, path)``. Files live in ``<folder>/<ab>/<hash><ext>``,
+    so identical uploads share one file and different ones never collide.
+    The content is hashed while it is copied to a temporary file, which is
+    then moved into place (or dropped if that content is already stored).
+    """
+    os.makedirs(folder, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.upload')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                tmp.write(chunk)
+        
+        content_hash = digest.hexdigest()
+        path = content_path(folder, content_hash, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return content_hash, path
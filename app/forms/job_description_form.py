@@ -1,9 +1,14 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, TextAreaField, SubmitField
-from wtforms.validators import DataRequired, Length
+from wtforms import StringField, TextAreaField, SubmitField, FloatField
+from wtforms.validators import DataRequired, Length, NumberRange, Optional
 
 class JobDescriptionForm(FlaskForm):
     title = StringField('Job Title', validators=[DataRequired(), Length(min=2, max=100)])
     company = StringField('Company', validators=[DataRequired(), Length(min=2, max=100)])
     description = TextAreaField('Job Description', validators=[DataRequired(), Length(min=50)])
+    # Optional ranking weights; blank fields use the site-wide defaults
+    similarity_weight = FloatField('Text similarity', validators=[Optional(), NumberRange(min=0)])
+    skills_weight = FloatField('Skills overlap', validators=[Optional(), NumberRange(min=0)])
+    education_weight = FloatField('Education', validators=[Optional(), NumberRange(min=0)])
+    experience_weight = FloatField('Experience', validators=[Optional(), NumberRange(min=0)])
     submit = SubmitField('Add Job Description')
@@ -0,0 +1,58 @@
+from app import mongo
+from bson.objectid import ObjectId
+
+# Marker for attributes that were left out of a query projection
+NOT_LOADED = object()
+
+def is_projected(projection, field):
+    """Whether a top-level field is (at least partly) present under a projection"""
+    if not projection:
+        return True
+    
+    keys = [key for key in projection if key != '_id']
+    if not keys:
+        # {'_id': 1} fetches nothing else, {'_id': 0} fetches everything else
+        return not projection.get('_id')
+    inclusive = any(projection[key] for key in keys)
+    if inclusive:
+        return any(key == field or key.startswith(field + '.') for key in keys)
+    return field not in keys
+
+def load_field(collection, document_id, path):
+    """Fetch a single (possibly dotted) field of a document"""
+    document = mongo.db[collection].find_one({'_id': ObjectId(document_id)}, {path: 1})
+    value = document
+    for part in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+class LazyField:
+    """Model attribute loaded from MongoDB on first access if it was projected out"""
+    
+    def __init__(self, path=None, decode=None):
+        self.path = path
+        self.decode = decode
+    
+    def __set_name__(self, owner, name):
+        self.slot = '_' + name
+        if self.path is None:
+            self.path = name
+    
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        value = getattr(obj, self.slot)
+        if value is NOT_LOADED:
+            value = load_field(obj.COLLECTION, obj.id, self.path) if obj.id else None
+            if self.decode is not None:
+                value = self.decode(value)
+            setattr(obj, self.slot, value)
+        return value
+    
+    def __set__(self, obj, value):
+        setattr(obj, self.slot, value)
+    
+    def is_loaded(self, obj):
+        return getattr(obj, self.slot) is not NOT_LOADED
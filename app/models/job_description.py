@@ -1,18 +1,37 @@
-from app import mongo
+from app import job_index, mongo, ranking_cache
+from app.models.fields import NOT_LOADED, LazyField, is_projected
+from app.nlp.storage import LEGACY_VECTOR_MODEL, decode_vector, encode_vector, stored_datetime
 from bson.objectid import ObjectId
 import datetime
 
 class JobDescription:
-    def __init__(self, jd_data=None):
+    COLLECTION = 'job_descriptions'
+    
+    # Just what the recruiter dashboard lists
+    SUMMARY_PROJECTION = {'recruiter_id': 1, 'title': 1, 'company': 1, 'upload_date': 1}
+    
+    # Everything except the vector and the duplicated raw text
+    DETAIL_PROJECTION = {'vector': 0, 'parsed_data.full_text': 0}
+    
+    __slots__ = ('id', 'recruiter_id', 'title', 'company', 'upload_date', 'updated_at', 'scoring_weights', 'vector_model', '_description', '_parsed_data', '_vector')
+    
+    description = LazyField()
+    parsed_data = LazyField()
+    vector = LazyField(decode=decode_vector)
+    
+    def __init__(self, jd_data=None, projection=None):
         if jd_data:
             self.id = str(jd_data.get('_id'))
             self.recruiter_id = jd_data.get('recruiter_id')
             self.title = jd_data.get('title')
             self.company = jd_data.get('company')
-            self.description = jd_data.get('description')
+            self.description = jd_data.get('description') if is_projected(projection, 'description') else NOT_LOADED
             self.upload_date = jd_data.get('upload_date')
-            self.parsed_data = jd_data.get('parsed_data', {})
-            self.vector = jd_data.get('vector')
+            self.updated_at = jd_data.get('updated_at')
+            self.scoring_weights = jd_data.get('scoring_weights')
+            self.parsed_data = jd_data.get('parsed_data', {}) if is_projected(projection, 'parsed_data') else NOT_LOADED
+            self.vector = decode_vector(jd_data.get('vector')) if is_projected(projection, 'vector') else NOT_LOADED
+            self.vector_model = jd_data.get('vector_model', LEGACY_VECTOR_MODEL)
         else:
             self.id = None
             self.recruiter_id = None
@@ -20,25 +39,46 @@ class JobDescription:
             self.company = None
             self.description = None
             self.upload_date = datetime.datetime.now()
+            self.updated_at = None
+            self.scoring_weights = None
             self.parsed_data = {}
             self.vector = None
+            self.vector_model = None
     
     def save(self):
+        self.updated_at = stored_datetime()
         jd_data = {
             'recruiter_id': self.recruiter_id,
             'title': self.title,
             'company': self.company,
-            'description': self.description,
             'upload_date': self.upload_date,
-            'parsed_data': self.parsed_data,
-            'vector': self.vector
+            'updated_at': self.updated_at
         }
+        if self.scoring_weights is not None:
+            jd_data['scoring_weights'] = self.scoring_weights
+        
+        # Only write back what was actually loaded, so a projected
+        # instance never clobbers the fields it did not fetch
+        if JobDescription.description.is_loaded(self):
+            jd_data['description'] = self.description
+        if JobDescription.vector.is_loaded(self):
+            jd_data['vector'] = encode_vector(self.vector)
+            jd_data['vector_model'] = self.vector_model
+        if JobDescription.parsed_data.is_loaded(self):
+            if 'full_text' in self.parsed_data or not self.id:
+                jd_data['parsed_data'] = self.parsed_data
+            else:
+                for key, value in self.parsed_data.items():
+                    jd_data['parsed_data.' + key] = value
         
         if self.id:
             mongo.db.job_descriptions.update_one(
                 {'_id': ObjectId(self.id)},
                 {'$set': jd_data}
             )
+            
+            # Rankings computed against the old description are stale
+            ranking_cache.invalidate_job(self.id)
         else:
             result = mongo.db.job_descriptions.insert_one(jd_data)
             self.id = str(result.inserted_id)
@@ -49,16 +89,79 @@ class JobDescription:
                 {'$push': {'job_descriptions': self.id}}
             )
         
+        # Keep the in-process job vector index in sync
+        if JobDescription.vector.is_loaded(self):
+            job_index.upsert(self.id, self.vector, self.vector_model, self.updated_at)
+        JobDescription.bump_generation()
+        
         return self.id
     
     @staticmethod
-    def get_by_id(jd_id):
-        jd_data = mongo.db.job_descriptions.find_one({'_id': ObjectId(jd_id)})
+    def generation():
+        """Counter that changes whenever any job description is written"""
+        counter = mongo.db.counters.find_one({'_id': 'job_descriptions'})
+        return counter.get('generation', 0) if counter else 0
+    
+    @staticmethod
+    def bump_generation():
+        mongo.db.counters.update_one({'_id': 'job_descriptions'}, {'$inc': {'generation': 1}}, upsert=True)
+    
+    @staticmethod
+    def get_by_id(jd_id, projection=None):
+        jd_data = mongo.db.job_descriptions.find_one({'_id': ObjectId(jd_id)}, projection)
         if jd_data:
-            return JobDescription(jd_data)
+            return JobDescription(jd_data, projection)
         return None
     
     @staticmethod
-    def get_by_recruiter_id(recruiter_id):
-        jds = mongo.db.job_descriptions.find({'recruiter_id': recruiter_id})
-        return [JobDescription(jd) for jd in jds]
+    def get_by_recruiter_id(recruiter_id, projection=None):
+        jds = mongo.db.job_descriptions.find({'recruiter_id': recruiter_id}, projection)
+        return [JobDescription(jd, projection) for jd in jds]
+    
+    @staticmethod
+    def get_many(jd_ids, projection=None):
+        """Fetch several job descriptions in one query, preserving the order of the given IDs"""
+        jds = mongo.db.job_descriptions.find(
+            {'_id': {'$in': [ObjectId(jd_id) for jd_id in jd_ids]}},
+            projection
+        )
+        by_id = {str(jd['_id']): JobDescription(jd, projection) for jd in jds}
+        return [by_id[jd_id] for jd_id in jd_ids if jd_id in by_id]
+    
+    @staticmethod
+    def ensure_indexes():
+        """Index ``updated_at``, which the in-process job index polls for changes"""
+        mongo.db.job_descriptions.create_index('updated_at')
+    
+    @staticmethod
+    def latest_vector():
+        """Vector of the most recently written vectorized job description, or None"""
+        jd = mongo.db.job_descriptions.find_one(
+            {'vector': {'$ne': None}}, {'vector': 1}, sort=[('updated_at', -1)]
+        )
+        return decode_vector(jd.get('vector')) if jd else None
+    
+    @staticmethod
+    def iter_vector_ids(batch_size=1000):
+        """Yield the IDs of all vectorized job descriptions"""
+        cursor = mongo.db.job_descriptions.find({'vector': {'$ne': None}}, {'_id': 1}).batch_size(batch_size)
+        for jd in cursor:
+            yield str(jd['_id'])
+    
+    @staticmethod
+    def iter_vectors(since=None, batch_size=1000):
+        """Yield ``(jd_id, vector, vector_model, updated_at)`` for vectorized job descriptions"""
+        query = {'vector': {'$ne': None}}
+        if since is not None:
+            query['updated_at'] = {'$gte': since}
+        cursor = mongo.db.job_descriptions.find(
+            query,
+            {'vector': 1, 'vector_model': 1, 'updated_at': 1}
+        ).batch_size(batch_size)
+        for jd in cursor:
+            yield (
+                str(jd['_id']),
+                decode_vector(jd.get('vector')),
+                jd.get('vector_model', LEGACY_VECTOR_MODEL),
+                jd.get('updated_at')
+            )
@@ -0,0 +1,53 @@
+from app import mongo
+from app.nlp.storage import decode_vector, encode_vector
+from pymongo.errors import OperationFailure
+import datetime
+
+class ParseCache:
+    """Parse results keyed by file content hash and parser version.
+
+    Identical uploads reuse the stored parsed data, and the stored vector
+    too while it was produced by the current vector model, so they skip
+    text extraction, spaCy and vectorization entirely. Entries expire
+    ``ttl`` seconds after they were written (see ``ensure_indexes``), so
+    results of old parser versions do not pile up.
+    """
+    
+    COLLECTION = 'parse_cache'
+    
+    @staticmethod
+    def ensure_indexes(ttl):
+        """TTL index on ``created_at``, updated in place when ``ttl`` changes"""
+        collection = mongo.db[ParseCache.COLLECTION]
+        try:
+            collection.create_index('created_at', expireAfterSeconds=ttl)
+        except OperationFailure:
+            # Already exists with another expiry
+            mongo.db.command('collMod', ParseCache.COLLECTION, index={
+                'keyPattern': {'created_at': 1}, 'expireAfterSeconds': ttl
+            })
+    
+    @staticmethod
+    def _key(content_hash, parser_version):
+        return f'{content_hash}:{parser_version}'
+    
+    @staticmethod
+    def get(content_hash, parser_version):
+        """``(parsed_data, vector, vector_model)`` for cached content, or None"""
+        entry = mongo.db[ParseCache.COLLECTION].find_one({'_id': ParseCache._key(content_hash, parser_version)})
+        if not entry:
+            return None
+        return entry['parsed_data'], decode_vector(entry.get('vector')), entry.get('vector_model')
+    
+    @staticmethod
+    def set(content_hash, parser_version, parsed_data, vector=None, vector_model=None):
+        mongo.db[ParseCache.COLLECTION].replace_one(
+            {'_id': ParseCache._key(content_hash, parser_version)},
+            {
+                'parsed_data': parsed_data,
+                'vector': encode_vector(vector) if vector is not None else None,
+                'vector_model': vector_model,
+                'created_at': datetime.datetime.now()
+            },
+            upsert=True
+        )
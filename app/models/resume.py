@@ -1,42 +1,106 @@
-from app import mongo
+from app import ann_index, mongo, resume_features, resume_index
+from app.models.fields import NOT_LOADED, LazyField, is_projected, load_field
+from app.nlp.storage import LEGACY_VECTOR_MODEL, decode_vector, encode_vector, stored_datetime
 from bson.objectid import ObjectId
 import datetime
 
 class Resume:
-    def __init__(self, resume_data=None):
+    COLLECTION = 'resumes'
+    
+    # Everything except the large vector and raw text, for dashboards and listings
+    SUMMARY_PROJECTION = {'vector': 0, 'parsed_data.full_text': 0}
+    
+    __slots__ = ('id', 'user_id', 'filename', 'upload_date', 'updated_at', 'status', 'error', 'source_file', 'content_hash', 'vector_model', '_parsed_data', '_vector')
+    
+    parsed_data = LazyField()
+    vector = LazyField(decode=decode_vector)
+    
+    def __init__(self, resume_data=None, projection=None):
         if resume_data:
             self.id = str(resume_data.get('_id'))
             self.user_id = resume_data.get('user_id')
             self.filename = resume_data.get('filename')
             self.upload_date = resume_data.get('upload_date')
-            self.parsed_data = resume_data.get('parsed_data', {})
-            self.vector = resume_data.get('vector')
+            self.updated_at = resume_data.get('updated_at')
+            # Resumes stored before background parsing existed are complete
+            self.status = resume_data.get('status', 'ready')
+            self.error = resume_data.get('error')
+            self.source_file = resume_data.get('source_file')
+            self.content_hash = resume_data.get('content_hash')
+            self.parsed_data = resume_data.get('parsed_data', {}) if is_projected(projection, 'parsed_data') else NOT_LOADED
+            self.vector = decode_vector(resume_data.get('vector')) if is_projected(projection, 'vector') else NOT_LOADED
+            self.vector_model = resume_data.get('vector_model', LEGACY_VECTOR_MODEL)
         else:
             self.id = None
             self.user_id = None
             self.filename = None
             self.upload_date = datetime.datetime.now()
+            self.updated_at = None
+            self.status = 'processing'
+            self.error = None
+            self.source_file = None
+            self.content_hash = None
             self.parsed_data = {}
             self.vector = None
+            self.vector_model = None
+    
+    @property
+    def full_text(self):
+        """Raw resume text, fetched on first access if it was projected out"""
+        if 'full_text' not in self.parsed_data and self.id:
+            self.parsed_data['full_text'] = load_field(self.COLLECTION, self.id, 'parsed_data.full_text')
+        return self.parsed_data.get('full_text')
     
-    def save(self):
+    def save(self, only_if=None):
+        """Insert or update the resume, returning its ID.
+        
+        ``only_if`` adds conditions the stored resume must still meet for an
+        update to happen; when it no longer does, nothing is written and
+        None is returned.
+        """
+        self.updated_at = stored_datetime()
         resume_data = {
             'user_id': self.user_id,
             'filename': self.filename,
             'upload_date': self.upload_date,
-            'parsed_data': self.parsed_data,
-            'vector': self.vector
+            'updated_at': self.updated_at,
+            'status': self.status,
+            'error': self.error,
+            'source_file': self.source_file,
+            'content_hash': self.content_hash
         }
         
+        # Only write back what was actually loaded, so a projected
+        # instance never clobbers the fields it did not fetch
+        if Resume.vector.is_loaded(self):
+            resume_data['vector'] = encode_vector(self.vector)
+            resume_data['vector_model'] = self.vector_model
+        if Resume.parsed_data.is_loaded(self):
+            if 'full_text' in self.parsed_data or not self.id:
+                resume_data['parsed_data'] = self.parsed_data
+            else:
+                for key, value in self.parsed_data.items():
+                    resume_data['parsed_data.' + key] = value
+        
         if self.id:
-            mongo.db.resumes.update_one(
-                {'_id': ObjectId(self.id)},
-                {'$set': resume_data}
-            )
+            query = {'_id': ObjectId(self.id)}
+            if only_if:
+                query.update(only_if)
+            result = mongo.db.resumes.update_one(query, {'$set': resume_data})
+            if only_if and not result.matched_count:
+                return None
         else:
             result = mongo.db.resumes.insert_one(resume_data)
             self.id = str(result.inserted_id)
         
+        # Keep the in-process vector indexes in sync
+        if Resume.vector.is_loaded(self):
+            resume_index.upsert(self.id, self.vector, self.vector_model, self.updated_at)
+            ann_index.upsert(self.id, self.vector, self.vector_model)
+        if Resume.parsed_data.is_loaded(self):
+            resume_features.upsert(self.id, self.parsed_data, self.updated_at)
+        Resume.bump_generation()
+        
         # Update user's resume_id
         mongo.db.users.update_one(
             {'_id': ObjectId(self.user_id)},
@@ -46,20 +110,145 @@ class Resume:
         return self.id
     
     @staticmethod
-    def get_by_id(resume_id):
-        resume_data = mongo.db.resumes.find_one({'_id': ObjectId(resume_id)})
+    def generation():
+        """Counter that changes whenever any resume is written"""
+        counter = mongo.db.counters.find_one({'_id': 'resumes'})
+        return counter.get('generation', 0) if counter else 0
+    
+    @staticmethod
+    def bump_generation():
+        mongo.db.counters.update_one({'_id': 'resumes'}, {'$inc': {'generation': 1}}, upsert=True)
+    
+    @staticmethod
+    def insert_many(resumes):
+        """Insert several new resumes with a single bulk write"""
+        if not resumes:
+            return []
+        
+        now = stored_datetime()
+        documents = []
+        for resume in resumes:
+            resume.updated_at = now
+            documents.append({
+                'user_id': resume.user_id,
+                'filename': resume.filename,
+                'upload_date': resume.upload_date,
+                'updated_at': resume.updated_at,
+                'status': resume.status,
+                'error': resume.error,
+                'source_file': resume.source_file,
+                'content_hash': resume.content_hash,
+                'parsed_data': resume.parsed_data,
+                'vector': encode_vector(resume.vector),
+                'vector_model': resume.vector_model
+            })
+        
+        result = mongo.db.resumes.insert_many(documents, ordered=False)
+        for resume, inserted_id in zip(resumes, result.inserted_ids):
+            resume.id = str(inserted_id)
+            resume_index.upsert(resume.id, resume.vector, resume.vector_model, resume.updated_at)
+            ann_index.upsert(resume.id, resume.vector, resume.vector_model)
+            resume_features.upsert(resume.id, resume.parsed_data, resume.updated_at)
+        Resume.bump_generation()
+        
+        return [resume.id for resume in resumes]
+    
+    @staticmethod
+    def claim_stale(resume_id, stale_before):
+        """Take over a resume left 'processing' since before ``stale_before``.
+        
+        Only one process wins the claim, so a lost parse job is requeued once.
+        """
+        result = mongo.db.resumes.update_one(
+            {'_id': ObjectId(resume_id), 'status': 'processing', 'updated_at': {'$lt': stale_before}},
+            {'$set': {'updated_at': stored_datetime()}}
+        )
+        return result.modified_count == 1
+    
+    @staticmethod
+    def find_stale(stale_before, projection=None):
+        """Resumes still 'processing' since before ``stale_before``"""
+        resumes = mongo.db.resumes.find(
+            {'status': 'processing', 'updated_at': {'$lt': stale_before}}, projection
+        )
+        return [Resume(resume, projection) for resume in resumes]
+    
+    @staticmethod
+    def get_by_id(resume_id, projection=None):
+        resume_data = mongo.db.resumes.find_one({'_id': ObjectId(resume_id)}, projection)
         if resume_data:
-            return Resume(resume_data)
+            return Resume(resume_data, projection)
         return None
     
     @staticmethod
-    def get_by_user_id(user_id):
-        resume_data = mongo.db.resumes.find_one({'user_id': user_id})
+    def get_by_user_id(user_id, projection=None):
+        resume_data = mongo.db.resumes.find_one({'user_id': user_id}, projection)
         if resume_data:
-            return Resume(resume_data)
+            return Resume(resume_data, projection)
         return None
     
     @staticmethod
-    def get_all():
-        resumes = mongo.db.resumes.find()
-        return [Resume(resume) for resume in resumes]
+    def get_all(projection=None):
+        resumes = mongo.db.resumes.find({}, projection)
+        return [Resume(resume, projection) for resume in resumes]
+    
+    @staticmethod
+    def get_many(resume_ids, projection=None):
+        """Fetch several resumes in one query, preserving the order of the given IDs"""
+        resumes = mongo.db.resumes.find(
+            {'_id': {'$in': [ObjectId(resume_id) for resume_id in resume_ids]}},
+            projection
+        )
+        by_id = {str(resume['_id']): Resume(resume, projection) for resume in resumes}
+        return [by_id[resume_id] for resume_id in resume_ids if resume_id in by_id]
+    
+    @staticmethod
+    def ensure_indexes():
+        """Index ``updated_at``, which the in-process indexes poll for changes"""
+        mongo.db.resumes.create_index('updated_at')
+    
+    @staticmethod
+    def latest_vector():
+        """Vector of the most recently written vectorized resume, or None"""
+        resume = mongo.db.resumes.find_one(
+            {'vector': {'$ne': None}}, {'vector': 1}, sort=[('updated_at', -1)]
+        )
+        return decode_vector(resume.get('vector')) if resume else None
+    
+    @staticmethod
+    def iter_vector_ids(batch_size=1000):
+        """Yield the IDs of all vectorized resumes"""
+        cursor = mongo.db.resumes.find({'vector': {'$ne': None}}, {'_id': 1}).batch_size(batch_size)
+        for resume in cursor:
+            yield str(resume['_id'])
+    
+    @staticmethod
+    def iter_vectors(since=None, batch_size=1000):
+        """Yield ``(resume_id, vector, vector_model, updated_at)`` for vectorized resumes"""
+        query = {'vector': {'$ne': None}}
+        if since is not None:
+            query['updated_at'] = {'$gte': since}
+        cursor = mongo.db.resumes.find(
+            query,
+            {'vector': 1, 'vector_model': 1, 'updated_at': 1}
+        ).batch_size(batch_size)
+        for resume in cursor:
+            yield (
+                str(resume['_id']),
+                decode_vector(resume.get('vector')),
+                resume.get('vector_model', LEGACY_VECTOR_MODEL),
+                resume.get('updated_at')
+            )
+    
+    @staticmethod
+    def iter_scoring_data(since=None, batch_size=1000):
+        """Yield ``(resume_id, parsed_data, updated_at)`` with just the fields used for hybrid scoring"""
+        query = {'parsed_data': {'$ne': None}}
+        if since is not None:
+            query['updated_at'] = {'$gte': since}
+        cursor = mongo.db.resumes.find(query, {
+            'parsed_data.skills': 1, 'parsed_data.skill_keys': 1,
+            'parsed_data.education': 1, 'parsed_data.experience': 1, 'updated_at': 1
+        }).batch_size(batch_size)
+        for resume in cursor:
+            yield str(resume['_id']), resume.get('parsed_data') or {}, resume.get('updated_at')
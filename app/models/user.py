@@ -1,6 +1,10 @@
 from flask_login import UserMixin
 from app import mongo, login_manager
 from bson.objectid import ObjectId
+from app.cache import TTLCache
+
+# User names shown in ranking results, shared across requests
+_user_name_cache = TTLCache(maxsize=50000, ttl=300)
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -28,3 +32,23 @@ class User(UserMixin):
         if user_data:
             return User(user_data)
         return None
+    
+    @staticmethod
+    def get_names(user_ids):
+        """Map user IDs to display names with one batched query for cache misses"""
+        user_ids = {user_id for user_id in user_ids if user_id}
+        names = _user_name_cache.get_many(user_ids)
+        
+        missing = [ObjectId(user_id) for user_id in user_ids - names.keys() if ObjectId.is_valid(user_id)]
+        if missing:
+            fetched = {
+                str(user['_id']): user.get('name', 'Unknown')
+                for user in mongo.db.users.find({'_id': {'$in': missing}}, {'name': 1})
+            }
+            # Remember unknown users too so they are not queried again
+            for user_id in missing:
+                fetched.setdefault(str(user_id), 'Unknown')
+            _user_name_cache.set_many(fetched)
+            names.update(fetched)
+        
+        return names
@@ -0,0 +1,412 @@
+import atexit
+import datetime
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+
+from app.nlp.index import DenseRows, advance_sync, poll_since
+from app.nlp.matrix import normalize_vector, top_k_indices
+
+try:
+    import hnswlib
+except ImportError:  # optional dependency
+    hnswlib = None
+
+logger = logging.getLogger(__name__)
+
+def _replace_from_tmp(directory, names):
+    """Move finished ``<name>.tmp`` files into place"""
+    for name in names:
+        os.replace(directory / (name + ".tmp"), directory / name)
+
+class IVFIndex:
+    """Inverted-file index over unit vectors, built with spherical k-means.
+
+    Vectors are bucketed by their nearest centroid; a query scores the
+    centroids and then only the vectors in the ``nprobe`` best buckets.
+    More probes means higher recall and higher latency.
+    """
+
+    backend = "ivf"
+    FILES = ("ivf.npz", "ivf_ids.json")
+
+    def __init__(self, dimension, nlist=None):
+        self.dimension = dimension
+        self.nlist = nlist
+        self.centroids = np.zeros((0, dimension), dtype=np.float32)
+        self.ids = []
+        self._positions = {}
+        self._rows = DenseRows(dimension)
+        self._assignments = []
+        self._lists = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def train(self, vectors, iterations=10, sample_size=20000, seed=0):
+        """Fit centroids on (a sample of) unit vectors"""
+        rng = np.random.default_rng(seed)
+        n = vectors.shape[0]
+        nlist = self.nlist or max(1, int(np.sqrt(n)))
+        nlist = min(nlist, n)
+        sample = vectors[rng.choice(n, size=min(n, sample_size), replace=False)]
+
+        centroids = sample[rng.choice(sample.shape[0], size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assignments == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            norms = np.linalg.norm(centroids, axis=1)
+            norms[norms == 0] = 1.0
+            centroids /= norms[:, np.newaxis]
+
+        self.centroids = centroids.astype(np.float32)
+        self.nlist = nlist
+
+    def build(self, ids, vectors):
+        """Train on and index a full set of unit vectors"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.train(vectors)
+        self.ids = list(ids)
+        self._positions = {item_id: i for i, item_id in enumerate(self.ids)}
+        self._rows = DenseRows(self.dimension, vectors.copy())
+        self._assignments = np.argmax(vectors @ self.centroids.T, axis=1).tolist()
+        self._rebuild_lists()
+
+    def _rebuild_lists(self):
+        self._lists = [[] for _ in range(self.nlist)]
+        for position, cluster in enumerate(self._assignments):
+            self._lists[cluster].append(position)
+
+    def upsert(self, item_id, vector):
+        vector = normalize_vector(vector)
+        cluster = int(np.argmax(self.centroids @ vector))
+        position = self._positions.get(item_id)
+        if position is None:
+            position = len(self.ids)
+            self.ids.append(item_id)
+            self._positions[item_id] = position
+            self._rows.append(vector)
+            self._assignments.append(cluster)
+        else:
+            self._lists[self._assignments[position]].remove(position)
+            self._rows.replace(position, vector)
+            self._assignments[position] = cluster
+        self._lists[cluster].append(position)
+
+    def search(self, query, k, effort=8):
+        """Approximate top-k ``(ids, scores)``; ``effort`` is the number of probed buckets"""
+        query = normalize_vector(query)
+        nprobe = min(max(int(effort), 1), self.nlist)
+        probed = top_k_indices(self.centroids @ query, nprobe)
+        candidates = np.array(
+            sorted(position for cluster in probed for position in self._lists[cluster]),
+            dtype=np.int64
+        )
+        if not len(candidates):
+            return [], np.empty(0, dtype=np.float32)
+        scores = self._rows.take(candidates) @ query
+        best = top_k_indices(scores, k)
+        return [self.ids[i] for i in candidates[best]], scores[best]
+
+    def save(self, directory, generation):
+        """Write the files of one snapshot generation, returning their names"""
+        vectors_name, ids_name = f"ivf.{generation}.npz", f"ivf_ids.{generation}.json"
+        with open(directory / (vectors_name + ".tmp"), "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                vectors=self._rows.matrix(),
+                assignments=np.asarray(self._assignments, dtype=np.int64)
+            )
+        with open(directory / (ids_name + ".tmp"), "w") as f:
+            json.dump(self.ids, f)
+        _replace_from_tmp(directory, (vectors_name, ids_name))
+        return [vectors_name, ids_name]
+
+    @classmethod
+    def load(cls, directory, files):
+        vectors_name, ids_name = files
+        with np.load(directory / vectors_name) as data:
+            index = cls(data["centroids"].shape[1], nlist=data["centroids"].shape[0])
+            index.centroids = data["centroids"]
+            index._rows = DenseRows(index.dimension, data["vectors"])
+            index._assignments = data["assignments"].tolist()
+        with open(directory / ids_name) as f:
+            index.ids = json.load(f)
+        index._positions = {item_id: i for i, item_id in enumerate(index.ids)}
+        index._rebuild_lists()
+        return index
+
+class HNSWIndex:
+    """hnswlib graph index on inner product; ``effort`` maps to the ``ef`` search parameter"""
+
+    backend = "hnsw"
+    FILES = ("hnsw.bin", "hnsw_ids.json")
+
+    def __init__(self, dimension, capacity=1024, m=16, ef_construction=200):
+        self.dimension = dimension
+        self.ids = []
+        self._labels = {}
+        self._index = hnswlib.Index(space="ip", dim=dimension)
+        self._index.init_index(max_elements=capacity, M=m, ef_construction=ef_construction)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def build(self, ids, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self._index.resize_index(max(len(ids), 1))
+        self.ids = list(ids)
+        self._labels = {item_id: i for i, item_id in enumerate(self.ids)}
+        if len(self.ids):
+            self._index.add_items(vectors, np.arange(len(self.ids)))
+
+    def upsert(self, item_id, vector):
+        vector = normalize_vector(vector)
+        label = self._labels.get(item_id)
+        if label is None:
+            label = len(self.ids)
+            if label >= self._index.get_max_elements():
+                self._index.resize_index(max(2 * label, 1024))
+            self.ids.append(item_id)
+            self._labels[item_id] = label
+        # Adding an existing label replaces its vector
+        self._index.add_items(vector[np.newaxis, :], np.array([label]))
+
+    def search(self, query, k, effort=64):
+        if not len(self.ids):
+            return [], np.empty(0, dtype=np.float32)
+        k = min(k, len(self.ids))
+        self._index.set_ef(max(int(effort), k))
+        labels, distances = self._index.knn_query(normalize_vector(query)[np.newaxis, :], k=k)
+        # Inner-product "distance" is 1 - similarity
+        return [self.ids[label] for label in labels[0]], (1.0 - distances[0]).astype(np.float32)
+
+    def save(self, directory, generation):
+        """Write the files of one snapshot generation, returning their names"""
+        graph_name, ids_name = f"hnsw.{generation}.bin", f"hnsw_ids.{generation}.json"
+        self._index.save_index(str(directory / (graph_name + ".tmp")))
+        with open(directory / (ids_name + ".tmp"), "w") as f:
+            json.dump(self.ids, f)
+        _replace_from_tmp(directory, (graph_name, ids_name))
+        return [graph_name, ids_name]
+
+    @classmethod
+    def load(cls, directory, files, dimension):
+        graph_name, ids_name = files
+        index = cls.__new__(cls)
+        index.dimension = dimension
+        index._index = hnswlib.Index(space="ip", dim=dimension)
+        index._index.load_index(str(directory / graph_name))
+        with open(directory / ids_name) as f:
+            index.ids = json.load(f)
+        index._labels = {item_id: i for i, item_id in enumerate(index.ids)}
+        return index
+
+class ANNIndex:
+    """Optional approximate nearest-neighbour index for dense resume embeddings.
+
+    Only vectors from one dense model (the spaCy embeddings by default) are
+    indexed. Uses hnswlib when it is installed and a NumPy IVF index
+    otherwise. The index is built from the resume vector index, kept up to
+    date by ``Resume.save()`` in this process and by polling for resumes
+    saved by other processes, and persisted under ``ANN_INDEX_DIR``.
+    """
+
+    META_FILE = "ann.json"
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.backend = "auto"
+        self.vector_model = None
+        self.directory = None
+        self.default_effort = None
+        self.nlist = None
+        self.index = None
+        self.last_sync = None
+        self.sync_overlap = 120
+        self._dirty = False
+        self._snapshot_generation = 0
+        self._synced_generation = None
+        self._lock = threading.RLock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("ANN_ENABLED", False)
+        self.backend = app.config.get("ANN_BACKEND", "auto")
+        self.vector_model = app.config.get("ANN_VECTOR_MODEL", "spacy:en_core_web_md")
+        self.directory = Path(app.config.get(
+            "ANN_INDEX_DIR", os.path.join(app.root_path, "nlp", "models", "ann")
+        ))
+        self.default_effort = app.config.get("ANN_SEARCH_EFFORT")
+        self.nlist = app.config.get("ANN_NLIST")
+        self.sync_overlap = app.config.get("RESUME_INDEX_SYNC_OVERLAP", 120)
+        app.extensions["ann_index"] = self
+        if self.enabled:
+            self.load()
+            atexit.register(self.save)
+
+    def scratch(self):
+        """A new in-memory index with the same settings, never synced or saved"""
+        index = ANNIndex()
+        index.enabled = True
+        index.backend = self.backend
+        index.vector_model = self.vector_model
+        index.default_effort = self.default_effort
+        index.nlist = self.nlist
+        return index
+
+    @property
+    def ready(self):
+        return self.enabled and self.index is not None
+
+    def backend_name(self):
+        if self.backend == "auto":
+            return "hnsw" if hnswlib is not None else "ivf"
+        return self.backend
+
+    def supports(self, vector_model):
+        """Whether queries for vectors from this model can be answered here"""
+        return self.ready and vector_model == self.vector_model
+
+    def build(self, ids, vectors, last_sync=None):
+        """Build a fresh index from unit vectors of the configured model"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(ids):
+            return
+        backend = self.backend_name()
+        if backend == "hnsw":
+            if hnswlib is None:
+                raise RuntimeError("ANN_BACKEND is 'hnsw' but hnswlib is not installed")
+            index = HNSWIndex(vectors.shape[1])
+        else:
+            index = IVFIndex(vectors.shape[1], nlist=self.nlist)
+        index.build(ids, vectors)
+        with self._lock:
+            self.index = index
+            self.last_sync = last_sync
+            self._dirty = True
+
+    def build_from(self, resume_index):
+        """Build from the rows of the resume vector index that match the model"""
+        matrix = resume_index.matrix()
+        rows = matrix.rows_for_version(self.vector_model)
+        vectors = matrix.matrix[rows]
+        if sparse.issparse(vectors):
+            vectors = vectors.toarray()
+        self.build([matrix.ids[i] for i in rows], vectors, last_sync=resume_index.last_sync)
+
+    def upsert(self, item_id, vector, vector_model):
+        if not self.ready or vector_model != self.vector_model or vector is None:
+            return
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.shape[0] != self.index.dimension:
+            return
+        with self._lock:
+            self.index.upsert(item_id, vector)
+            self._dirty = True
+
+    def refresh(self):
+        """Apply resumes saved by other processes since the last sync"""
+        from app.models.resume import Resume
+
+        if not self.ready:
+            return
+        with self._lock:
+            since = poll_since(self.last_sync, self.sync_overlap)
+            for resume_id, vector, vector_model, updated_at in Resume.iter_vectors(since=since):
+                self.upsert(resume_id, vector, vector_model)
+                self.last_sync = advance_sync(self.last_sync, updated_at)
+
+    def sync(self, generation):
+        """Refresh if ``generation``, the resumes' write counter, moved since the last call"""
+        if generation != self._synced_generation:
+            self.refresh()
+            self._synced_generation = generation
+
+    def search(self, query, k, effort=None):
+        """Approximate top-k ``(ids, scores)`` for a query vector, best first"""
+        effort = effort or self.default_effort
+        with self._lock:
+            if effort is None:
+                return self.index.search(query, k)
+            return self.index.search(query, k, effort=effort)
+
+    def _read_meta(self):
+        try:
+            with open(self.directory / self.META_FILE) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, force=False):
+        """Persist the index atomically, if it changed.
+
+        Each save writes its files under a new generation number and then
+        replaces the metadata naming them, so readers never see a mix of
+        two saves. A snapshot saved by another process since this one was
+        loaded is left alone unless ``force`` is set.
+        """
+        if self.directory is None or self.index is None or not self._dirty:
+            return False
+        disk_meta = self._read_meta() or {}
+        disk_generation = disk_meta.get("generation", 0)
+        if not force and disk_generation > self._snapshot_generation:
+            logger.info("ann_index: a newer snapshot is on disk, not overwriting it")
+            return False
+        generation = disk_generation + 1
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            files = self.index.save(self.directory, generation)
+            self._dirty = False
+            meta = {
+                "backend": self.index.backend,
+                "dimension": self.index.dimension,
+                "vector_model": self.vector_model,
+                "files": files,
+                "generation": generation,
+                "last_sync": self.last_sync.isoformat() if self.last_sync else None,
+            }
+        meta_tmp = self.directory / (self.META_FILE + ".tmp")
+        with open(meta_tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(meta_tmp, self.directory / self.META_FILE)
+        self._snapshot_generation = generation
+
+        previous = disk_meta.get("files")
+        if disk_meta and not previous:
+            previous = HNSWIndex.FILES if disk_meta.get("backend") == "hnsw" else IVFIndex.FILES
+        for name in set(previous or ()) - set(files):
+            try:
+                os.remove(self.directory / name)
+            except FileNotFoundError:
+                pass
+        return True
+
+    def load(self):
+        """Load a persisted index built for the configured model"""
+        meta = self._read_meta()
+        if meta is None or meta.get("vector_model") != self.vector_model:
+            return False
+        if meta["backend"] == "hnsw":
+            if hnswlib is None:
+                return False
+            index = HNSWIndex.load(self.directory, meta.get("files") or HNSWIndex.FILES, meta["dimension"])
+        else:
+            index = IVFIndex.load(self.directory, meta.get("files") or IVFIndex.FILES)
+        with self._lock:
+            self.index = index
+            self.last_sync = datetime.datetime.fromisoformat(meta["last_sync"]) if meta.get("last_sync") else None
+            self._snapshot_generation = meta.get("generation", 0)
+            self._dirty = False
+        return True
@@ -0,0 +1,632 @@
+import atexit
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from scipy import sparse
+
+from app.nlp.matrix import SPARSE_DENSITY_THRESHOLD, VectorMatrix, normalize_vector
+from app.nlp.retrieval import TermPostings
+from app.nlp.storage import LEGACY_VECTOR_MODEL, has_vector, stored_datetime
+
+logger = logging.getLogger(__name__)
+
+def poll_since(last_sync, overlap):
+    """Lower bound of ``updated_at`` for the next poll for changes.
+
+    ``updated_at`` is stamped by the writer before its write commits, and
+    hosts' clocks drift, so a document can become visible with a timestamp
+    older than ones already seen. Polling re-reads the last ``overlap``
+    seconds to catch those; applying a document twice is harmless.
+    """
+    if last_sync is None:
+        return None
+    return last_sync - datetime.timedelta(seconds=overlap)
+
+def advance_sync(last_sync, updated_at):
+    """The newer of the high-water mark and a document's ``updated_at``, at stored precision"""
+    if updated_at is None:
+        return last_sync
+    updated_at = stored_datetime(updated_at)
+    return updated_at if last_sync is None or updated_at > last_sync else last_sync
+
+def _grow(array, capacity):
+    """Copy of a 1-D buffer with room for ``capacity`` entries"""
+    grown = np.zeros(capacity, dtype=array.dtype)
+    grown[:array.shape[0]] = array
+    return grown
+
+class DenseRows:
+    """Float32 row buffer whose capacity doubles as rows are added"""
+
+    storage = "dense"
+
+    def __init__(self, dimension, vectors=None):
+        self.dimension = dimension
+        self._vectors = vectors
+        self._size = 0 if vectors is None else vectors.shape[0]
+
+    def __len__(self):
+        return self._size
+
+    def append(self, row):
+        if self._vectors is None or self._vectors.shape[0] <= self._size:
+            capacity = max(self._size + 1, 2 * self._size, 64)
+            grown = np.zeros((capacity, self.dimension), dtype=np.float32)
+            if self._vectors is not None:
+                grown[:self._size] = self._vectors[:self._size]
+            self._vectors = grown
+        self._vectors[self._size] = row
+        self._size += 1
+
+    def replace(self, position, row):
+        self._vectors[position] = row
+
+    def matrix(self):
+        if self._vectors is None:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return self._vectors[:self._size]
+
+    def take(self, positions):
+        return self.matrix()[positions]
+
+    def subset(self, positions):
+        """New rows holding just the given positions, in order"""
+        return DenseRows(self.dimension, self.take(positions))
+
+    def save(self, file):
+        np.save(file, np.ascontiguousarray(self.matrix()))
+
+    @classmethod
+    def load(cls, path, dimension, size):
+        # Copy-on-write mapping: pages are shared until a row is updated
+        # (an empty array cannot be memory-mapped)
+        vectors = np.load(path, mmap_mode="c" if size else None)
+        return cls(dimension, vectors if size else None)
+
+class SparseRows:
+    """CSR row storage for sparse vectors such as TF-IDF.
+
+    Only the non-zero components are kept, in flat buffers whose capacity
+    doubles as rows are added. A row replaced by one with a different
+    number of non-zeros is written at the end of the buffers, and the
+    buffers are compacted the next time the matrix is read.
+    """
+
+    storage = "sparse"
+
+    def __init__(self, dimension):
+        self.dimension = dimension
+        self._data = np.zeros(0, dtype=np.float32)
+        self._indices = np.zeros(0, dtype=np.int32)
+        self._starts = np.zeros(0, dtype=np.int64)
+        self._lengths = np.zeros(0, dtype=np.int64)
+        self._size = 0
+        self._used = 0
+        self._compact = True
+
+    def __len__(self):
+        return self._size
+
+    def _write(self, row):
+        indices = np.flatnonzero(row)
+        end = self._used + indices.shape[0]
+        if end > self._data.shape[0]:
+            capacity = max(end, 2 * self._data.shape[0], 1024)
+            self._data = _grow(self._data, capacity)
+            self._indices = _grow(self._indices, capacity)
+        self._data[self._used:end] = row[indices]
+        self._indices[self._used:end] = indices
+        start, self._used = self._used, end
+        return start, indices.shape[0]
+
+    def append(self, row):
+        if self._size >= self._starts.shape[0]:
+            capacity = max(2 * self._size, 64)
+            self._starts = _grow(self._starts, capacity)
+            self._lengths = _grow(self._lengths, capacity)
+        self._starts[self._size], self._lengths[self._size] = self._write(row)
+        self._size += 1
+
+    def replace(self, position, row):
+        indices = np.flatnonzero(row)
+        if indices.shape[0] == self._lengths[position]:
+            start = self._starts[position]
+            self._data[start:start + indices.shape[0]] = row[indices]
+            self._indices[start:start + indices.shape[0]] = indices
+            return
+        self._starts[position], self._lengths[position] = self._write(row)
+        self._compact = False
+
+    def _compact_buffers(self):
+        lengths = self._lengths[:self._size]
+        indptr = np.zeros(self._size + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        # Position of every live non-zero in the old buffers, in row order
+        gather = np.repeat(self._starts[:self._size] - indptr[:-1], lengths) + np.arange(indptr[-1])
+        self._data = self._data[gather]
+        self._indices = self._indices[gather]
+        self._starts[:self._size] = indptr[:-1]
+        self._used = int(indptr[-1])
+        self._compact = True
+
+    def matrix(self):
+        if not self._compact:
+            self._compact_buffers()
+        indptr = np.empty(self._size + 1, dtype=np.int64)
+        indptr[:-1] = self._starts[:self._size]
+        indptr[-1] = self._used
+        return sparse.csr_matrix(
+            (self._data[:self._used], self._indices[:self._used], indptr),
+            shape=(self._size, self.dimension)
+        )
+
+    def take(self, positions):
+        return self.matrix()[positions]
+
+    def subset(self, positions):
+        """New rows holding just the given positions, in order"""
+        matrix = self.take(positions)
+        return SparseRows._from_csr(self.dimension, matrix.data, matrix.indices, matrix.indptr)
+
+    def save(self, file):
+        matrix = self.matrix()
+        np.savez(file, data=matrix.data, indices=matrix.indices, indptr=matrix.indptr)
+
+    @classmethod
+    def _from_csr(cls, dimension, data, indices, indptr):
+        rows = cls(dimension)
+        indptr = np.asarray(indptr, dtype=np.int64)
+        rows._data = np.asarray(data, dtype=np.float32).copy()
+        rows._indices = np.asarray(indices, dtype=np.int32).copy()
+        rows._starts = indptr[:-1].copy()
+        rows._lengths = np.diff(indptr)
+        rows._size = indptr.shape[0] - 1
+        rows._used = int(indptr[-1])
+        return rows
+
+    @classmethod
+    def load(cls, path, dimension, size):
+        with np.load(path) as data:
+            return cls._from_csr(dimension, data["data"], data["indices"], data["indptr"])
+
+ROW_STORES = {store.storage: store for store in (DenseRows, SparseRows)}
+
+class VectorIndex:
+    """Process-wide index of normalized document vectors.
+
+    Sparse vectors (TF-IDF) are kept as CSR rows and dense ones (embeddings)
+    in one float32 matrix, chosen from the density of the first row the same
+    way ``VectorMatrix.from_vectors`` decides. The index is loaded from a
+    snapshot when the app starts (dense rows memory-mapped copy-on-write)
+    and kept in sync by the model's ``save()``. Changes made by other
+    processes are picked up by polling for documents whose ``updated_at``
+    is newer than the last sync, less an overlap window (see ``poll_since``). Subclasses name their snapshot files and
+    their source of vectors.
+
+    All rows share the dimension of the newest vector. A newer vector of
+    another size (a re-fitted model) triggers a full rebuild instead of
+    being dropped.
+    """
+
+    EXTENSION_NAME = None
+    VECTORS_FILE = None
+    META_FILE = None
+
+    def __init__(self, app=None):
+        self._lock = threading.RLock()
+        self._reset()
+        self.snapshot_dir = None
+        self.sync_interval = 30
+        self.sync_overlap = 120
+        self.prune_interval = 300
+        self._last_check = 0.0
+        self._last_prune = 0.0
+        self._dirty = False
+        self._needs_rebuild = False
+        self._snapshot_generation = 0
+        self._indexes_checked = False
+        self._synced_generation = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.snapshot_dir = Path(app.config.get(
+            "RESUME_INDEX_DIR", os.path.join(app.root_path, "nlp", "models", "index")
+        ))
+        self.sync_interval = app.config.get("RESUME_INDEX_SYNC_INTERVAL", 30)
+        self.sync_overlap = app.config.get("RESUME_INDEX_SYNC_OVERLAP", 120)
+        self.prune_interval = app.config.get("RESUME_INDEX_PRUNE_INTERVAL", 300)
+        app.extensions[self.EXTENSION_NAME] = self
+        self.load_snapshot()
+        atexit.register(self.save_snapshot)
+
+    def _reset(self):
+        self.ids = []
+        self.versions = []
+        self._positions = {}
+        self._rows = None
+        self.dimension = None
+        self.last_sync = None
+        self.loaded = False
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def storage(self):
+        return self._rows.storage if self._rows is not None else None
+
+    # Snapshot handling
+
+    def _vectors_name(self, storage, generation):
+        # Dense rows are a plain .npy array, sparse rows a .npz of CSR arrays.
+        # Each generation gets its own file, so replacing the meta file
+        # switches readers to a new snapshot in one step.
+        stem = Path(self.VECTORS_FILE).stem
+        suffix = ".npy" if storage == "dense" else ".npz"
+        return f"{stem}.{generation}{suffix}" if generation else stem + suffix
+
+    def _read_meta(self):
+        try:
+            with open(self.snapshot_dir / self.META_FILE) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def load_snapshot(self):
+        """Load the on-disk snapshot, if there is one"""
+        if self.snapshot_dir is None:
+            return False
+        meta = self._read_meta()
+        if meta is None:
+            return False
+        storage = meta.get("storage", "dense")
+        vectors_path = self.snapshot_dir / (
+            meta.get("vectors_file") or self._vectors_name(storage, None)
+        )
+        if not vectors_path.exists():
+            return False
+
+        ids = list(meta["ids"])
+        dimension = meta.get("dimension")
+        rows = ROW_STORES[storage].load(vectors_path, dimension, len(ids)) if dimension is not None else None
+
+        with self._lock:
+            self._reset()
+            self.ids = ids
+            self.versions = list(meta.get("versions") or [LEGACY_VECTOR_MODEL] * len(self.ids))
+            self._positions = {document_id: i for i, document_id in enumerate(self.ids)}
+            self._rows = rows
+            self.dimension = dimension
+            if meta.get("last_sync"):
+                self.last_sync = datetime.datetime.fromisoformat(meta["last_sync"])
+            self.loaded = True
+            self._dirty = False
+            self._snapshot_generation = meta.get("generation", 0)
+        return True
+
+    def save_snapshot(self, force=False):
+        """Write the current index to disk atomically.
+
+        A snapshot written by another process since this one was loaded is
+        newer than ours and is left alone, unless ``force`` is set (as the
+        CLI does after a full rebuild).
+        """
+        if self.snapshot_dir is None or not self.loaded or not self._dirty:
+            return False
+
+        meta_path = self.snapshot_dir / self.META_FILE
+        disk_meta = self._read_meta() or {}
+        disk_generation = disk_meta.get("generation", 0)
+        if not force and disk_generation > self._snapshot_generation:
+            logger.info("%s: a newer snapshot is on disk, not overwriting it", self.EXTENSION_NAME)
+            return False
+        generation = disk_generation + 1
+
+        with self._lock:
+            # Rebuilt from an empty collection: an empty dense array
+            rows = self._rows if self._rows is not None else DenseRows(self.dimension or 0)
+            vectors_name = self._vectors_name(rows.storage, generation)
+            meta = {
+                "ids": list(self.ids),
+                "versions": list(self.versions),
+                "dimension": self.dimension,
+                "storage": rows.storage,
+                "vectors_file": vectors_name,
+                "generation": generation,
+                "last_sync": self.last_sync.isoformat() if self.last_sync else None,
+            }
+            self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+            vectors_tmp = self.snapshot_dir / (vectors_name + ".tmp")
+            with open(vectors_tmp, "wb") as f:
+                rows.save(f)
+            self._dirty = False
+
+        meta_tmp = self.snapshot_dir / (self.META_FILE + ".tmp")
+        with open(meta_tmp, "w") as f:
+            json.dump(meta, f)
+        # Check again right before switching, in case another process saved meanwhile
+        if not force and (self._read_meta() or {}).get("generation", 0) != disk_generation:
+            os.remove(vectors_tmp)
+            os.remove(meta_tmp)
+            return False
+        os.replace(vectors_tmp, self.snapshot_dir / vectors_name)
+        os.replace(meta_tmp, meta_path)
+        self._snapshot_generation = generation
+
+        # Readers that mapped the previous file keep their mapping after it is unlinked
+        previous = disk_meta.get("vectors_file")
+        if disk_meta and not previous:
+            previous = self._vectors_name(disk_meta.get("storage", "dense"), None)
+        if previous and previous != vectors_name:
+            try:
+                os.remove(self.snapshot_dir / previous)
+            except FileNotFoundError:
+                pass
+        return True
+
+    # Building and syncing
+
+    def iter_vectors(self, since=None, batch_size=1000):
+        """Yield ``(id, vector, vector_model, updated_at)`` from the source collection"""
+        raise NotImplementedError
+
+    def iter_ids(self, batch_size=1000):
+        """Yield the IDs of the documents in the source collection that have a vector"""
+        raise NotImplementedError
+
+    def latest_vector(self):
+        """Vector of the most recently written document in the source collection"""
+        raise NotImplementedError
+
+    def ensure_indexes(self):
+        """Create the database indexes the polling queries rely on"""
+
+    def _check_indexes(self):
+        if not self._indexes_checked:
+            self.ensure_indexes()
+            self._indexes_checked = True
+
+    def rebuild(self, batch_size=1000):
+        """Rebuild the whole index from the source collection.
+
+        The newest vector decides the dimension; vectors of any other size
+        come from a model that has since been replaced and are skipped until
+        they are re-vectorized.
+        """
+        self._check_indexes()
+        latest = self.latest_vector()
+        with self._lock:
+            self._reset()
+            self.dimension = len(latest) if has_vector(latest) else None
+            skipped = 0
+            for document_id, vector, vector_model, updated_at in self.iter_vectors(batch_size=batch_size):
+                if not self._upsert(document_id, vector, vector_model, updated_at):
+                    skipped += 1
+            self.loaded = True
+            self._dirty = True
+            self._needs_rebuild = False
+            self._last_check = self._last_prune = time.monotonic()
+        if skipped:
+            logger.warning("%s: skipped %d vectors whose size differs from the newest (dimension %s)",
+                           self.EXTENSION_NAME, skipped, self.dimension)
+
+    def refresh(self, force=False):
+        """Apply changes saved by other processes since the last sync"""
+        if not self.loaded or self._needs_rebuild:
+            self.rebuild()
+            return
+
+        now = time.monotonic()
+        if not force and now - self._last_check < self.sync_interval:
+            return
+        self._last_check = now
+
+        self._check_indexes()
+        with self._lock:
+            since = poll_since(self.last_sync, self.sync_overlap)
+            for document_id, vector, vector_model, updated_at in self.iter_vectors(since=since):
+                self._upsert(document_id, vector, vector_model, updated_at)
+                if self._needs_rebuild:
+                    break
+        if self._needs_rebuild:
+            logger.info("%s: vectors of a new dimension arrived, rebuilding", self.EXTENSION_NAME)
+            self.rebuild()
+        elif self.prune_interval and now - self._last_prune >= self.prune_interval:
+            self._last_prune = now
+            self.prune()
+
+    def prune(self):
+        """Drop the rows of documents deleted from the source collection, or whose vector was removed.
+
+        Deletions leave nothing behind to poll for, so every indexed ID is
+        checked against the collection. Returns the number of rows dropped.
+        """
+        with self._lock:
+            indexed = set(self.ids)
+        # Only IDs indexed before the scan started can be judged by it
+        gone = indexed.difference(self.iter_ids())
+        if not gone:
+            return 0
+
+        with self._lock:
+            keep = np.fromiter(
+                (i for i, document_id in enumerate(self.ids) if document_id not in gone),
+                dtype=np.int64
+            )
+            self._rows = self._rows.subset(keep)
+            self.ids = [self.ids[i] for i in keep]
+            self.versions = [self.versions[i] for i in keep]
+            self._positions = {document_id: i for i, document_id in enumerate(self.ids)}
+            self._rows_replaced()
+            self._dirty = True
+        logger.info("%s: dropped %d documents no longer in the collection", self.EXTENSION_NAME, len(gone))
+        return len(gone)
+
+    def sync(self, generation):
+        """Refresh right away if ``generation``, the collection's write counter, moved since the last call"""
+        if generation != self._synced_generation:
+            self.refresh(force=True)
+            self._synced_generation = generation
+
+    def upsert(self, document_id, vector, vector_model=None, updated_at=None):
+        """Insert or replace the vector for a single document"""
+        if not self.loaded:
+            # Nothing to keep in sync yet; the first refresh rebuilds everything
+            return
+        with self._lock:
+            self._upsert(document_id, vector, vector_model, updated_at)
+
+    def _upsert(self, document_id, vector, vector_model, updated_at):
+        """Apply one document's vector; returns False if it was left out"""
+        if has_vector(vector) and self.dimension is not None and len(vector) != self.dimension:
+            # Vectors from a differently sized model cannot be compared. One
+            # written after everything indexed so far means the model was
+            # replaced, so the index is rebuilt around it; an older one is
+            # from the replaced model. Either way last_sync stays put.
+            if updated_at is None or self.last_sync is None or updated_at > self.last_sync:
+                self._needs_rebuild = True
+            return False
+
+        self.last_sync = advance_sync(self.last_sync, updated_at)
+        if not has_vector(vector):
+            return True
+
+        row = normalize_vector(vector)
+        if self.dimension is None:
+            self.dimension = row.shape[0]
+        if self._rows is None:
+            use_sparse = np.count_nonzero(row) < SPARSE_DENSITY_THRESHOLD * row.shape[0]
+            self._rows = SparseRows(self.dimension) if use_sparse else DenseRows(self.dimension)
+
+        position = self._positions.get(document_id)
+        if position is None:
+            position = len(self.ids)
+            self._rows.append(row)
+            self.ids.append(document_id)
+            self.versions.append(vector_model)
+            self._positions[document_id] = position
+        else:
+            self._rows.replace(position, row)
+            self.versions[position] = vector_model
+        self._row_updated(position, row)
+        self._dirty = True
+        return True
+
+    def _row_updated(self, position, row):
+        """Hook for subclasses keeping derived structures in step with the rows"""
+
+    def _rows_replaced(self):
+        """Hook for subclasses whose derived structures must be rebuilt after rows were removed"""
+
+    # Querying
+
+    def _empty_matrix(self):
+        return np.zeros((0, self.dimension or 0), dtype=np.float32)
+
+    def matrix(self):
+        """Return a ``VectorMatrix`` view over the current rows"""
+        self.refresh()
+        with self._lock:
+            if not self.ids:
+                return VectorMatrix([], self._empty_matrix())
+            return VectorMatrix(list(self.ids), self._rows.matrix(), list(self.versions))
+
+class ResumeIndex(VectorIndex):
+    """Vectors of all resumes, scored against a job description when ranking"""
+
+    EXTENSION_NAME = "resume_index"
+    VECTORS_FILE = "resume_vectors.npy"
+    META_FILE = "resume_index.json"
+
+    def _reset(self):
+        super()._reset()
+        self._term_postings = None
+
+    def _row_updated(self, position, row):
+        if self._term_postings is not None:
+            self._term_postings.update(position, row)
+
+    def _rows_replaced(self):
+        self._term_postings = None
+
+    def term_postings(self):
+        """Inverted index of each row's key terms, built on first use"""
+        self.refresh()
+        with self._lock:
+            if self._term_postings is None:
+                postings = TermPostings()
+                postings.build(self._rows.matrix() if self.ids else self._empty_matrix())
+                self._term_postings = postings
+            return self._term_postings
+
+    def positions(self, resume_ids):
+        """``{resume_id: row}`` for the given resumes that are indexed"""
+        with self._lock:
+            return {
+                resume_id: self._positions[resume_id]
+                for resume_id in resume_ids if resume_id in self._positions
+            }
+
+    def version_mask(self, positions, version):
+        """Which of the given rows hold a vector produced by ``version``"""
+        with self._lock:
+            return np.fromiter(
+                (self.versions[i] == version for i in positions), dtype=bool, count=len(positions)
+            )
+
+    def rows(self, positions):
+        """A ``VectorMatrix`` over just the given rows"""
+        with self._lock:
+            positions = np.asarray(positions, dtype=np.int64)
+            return VectorMatrix(
+                [self.ids[i] for i in positions],
+                self._rows.take(positions) if len(positions) else self._empty_matrix(),
+                [self.versions[i] for i in positions]
+            )
+
+    def iter_vectors(self, since=None, batch_size=1000):
+        from app.models.resume import Resume
+        return Resume.iter_vectors(since=since, batch_size=batch_size)
+
+    def iter_ids(self, batch_size=1000):
+        from app.models.resume import Resume
+        return Resume.iter_vector_ids(batch_size=batch_size)
+
+    def latest_vector(self):
+        from app.models.resume import Resume
+        return Resume.latest_vector()
+
+    def ensure_indexes(self):
+        from app.models.resume import Resume
+        Resume.ensure_indexes()
+
+class JobIndex(VectorIndex):
+    """Vectors of all job descriptions, scored against a resume to suggest jobs"""
+
+    EXTENSION_NAME = "job_index"
+    VECTORS_FILE = "job_vectors.npy"
+    META_FILE = "job_index.json"
+
+    def iter_vectors(self, since=None, batch_size=1000):
+        from app.models.job_description import JobDescription
+        return JobDescription.iter_vectors(since=since, batch_size=batch_size)
+
+    def iter_ids(self, batch_size=1000):
+        from app.models.job_description import JobDescription
+        return JobDescription.iter_vector_ids(batch_size=batch_size)
+
+    def latest_vector(self):
+        from app.models.job_description import JobDescription
+        return JobDescription.latest_vector()
+
+    def ensure_indexes(self):
+        from app.models.job_description import JobDescription
+        JobDescription.ensure_indexes()
@@ -0,0 +1,101 @@
+import numpy as np
+from scipy import sparse
+
+# Below this fraction of non-zero entries a CSR matrix is cheaper than a dense one
+SPARSE_DENSITY_THRESHOLD = 0.25
+
+def normalize_vector(vector):
+    """Return a float32 unit-length copy of a vector (zero vectors stay zero)"""
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector = vector / norm
+    return vector
+
+def top_k_indices(scores, k=None):
+    """Indices of the k highest scores, best first.
+
+    Ties keep their original row order, which is what a stable
+    ``list.sort(reverse=True)`` over the same rows would produce.
+    """
+    n = scores.shape[0]
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+
+    if k is None or k >= n:
+        candidates = np.arange(n)
+    else:
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        # Find the k-th best score without sorting everything, then keep
+        # every row that reaches it so ties are resolved deterministically
+        partitioned = np.argpartition(-scores, k - 1)[:k]
+        threshold = scores[partitioned].min()
+        candidates = np.flatnonzero(scores >= threshold)
+
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order][:k]
+
+class VectorMatrix:
+    """Pre-normalized float32 matrix of document vectors for bulk cosine scoring"""
+
+    def __init__(self, ids, matrix, versions=None):
+        self.ids = list(ids)
+        self.matrix = matrix
+        # Optional per-row tag of the model that produced each vector
+        self.versions = np.asarray(versions, dtype=object) if versions is not None else None
+
+    @classmethod
+    def from_vectors(cls, ids, vectors, use_sparse=None, versions=None):
+        """Build a matrix from equally sized vectors, one row per id"""
+        ids = list(ids)
+        if not ids:
+            return cls([], np.zeros((0, 0), dtype=np.float32))
+
+        dense = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(dense, axis=1)
+        norms[norms == 0] = 1.0
+        dense /= norms[:, np.newaxis]
+
+        if use_sparse is None:
+            use_sparse = np.count_nonzero(dense) < SPARSE_DENSITY_THRESHOLD * dense.size
+
+        matrix = sparse.csr_matrix(dense) if use_sparse else dense
+        return cls(ids, matrix, versions)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dimension(self):
+        return self.matrix.shape[1]
+
+    @property
+    def is_sparse(self):
+        return sparse.issparse(self.matrix)
+
+    def score(self, query_vector):
+        """Cosine similarity of every row against a query vector"""
+        if not len(self):
+            return np.empty(0, dtype=np.float32)
+
+        query = normalize_vector(query_vector)
+        scores = self.matrix.dot(query)
+        return np.asarray(scores, dtype=np.float32).ravel()
+
+    def rows_for_version(self, version):
+        """Indices of the rows produced by the given model version"""
+        if version is None or self.versions is None:
+            return np.arange(len(self))
+        return np.flatnonzero(self.versions == version)
+
+    def top_k(self, query_vector, k=None, version=None):
+        """Return ``(ids, scores)`` for the k best matching rows, best first.
+
+        With ``version`` set, rows produced by any other model are left out,
+        since scores across different vector spaces are meaningless.
+        """
+        scores = self.score(query_vector)
+        rows = self.rows_for_version(version)
+        indices = rows[top_k_indices(scores[rows], k)]
+        return [self.ids[i] for i in indices], scores[indices]
@@ -1,46 +1,175 @@
-import spacy
-import re
 import os
+import re
 import docx
 import PyPDF2
 from pathlib import Path
+from app.nlp.registry import get_model, model_for_vocab
+from app.nlp.skills import dictionary_version, find_phrase_skills, get_skill_matcher, normalize_skills
 
-# Load spaCy model
-try:
-    nlp = spacy.load("en_core_web_sm")
-except:
-    # If model not found, download it
-    os.system("python -m spacy download en_core_web_sm")
-    nlp = spacy.load("en_core_web_sm")
+MODEL_NAME = "en_core_web_sm"
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text from PDF file"""
-    text = ""
+# Bump whenever a change to extraction or parsing alters the parsed output,
+# so cached parse results from older versions are no longer used
+PARSER_VERSION = "2"
+
+def get_nlp():
+    """Shared full spaCy pipeline, loaded on first use"""
+    return get_model(MODEL_NAME)
+
+def __getattr__(name):
+    # Keep ``parser.nlp`` working without loading the model at import time
+    if name == "nlp":
+        return get_nlp()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Pipeline components each extraction task relies on. The tech-adjective
+# rule in extract_skills needs POS tags and the dependency parse; the
+# education and experience extractors need sentence boundaries (from the
+# parser) and named entities. Email and phone are plain regexes.
+TASK_COMPONENTS = {
+    "skills": {"tok2vec", "tagger", "attribute_ruler", "parser"},
+    "education": {"tok2vec", "parser", "ner"},
+    "experience": {"tok2vec", "parser", "ner"},
+}
+ALL_TASKS = tuple(TASK_COMPONENTS)
+
+# Fast mode drops the tagger and parser altogether and takes sentence
+# boundaries from the lightweight senter component instead
+FAST_EXCLUDE = ["tagger", "parser", "attribute_ruler", "lemmatizer"]
+
+def get_fast_nlp():
+    """Shared parser-free pipeline used in fast mode, loaded on first use"""
+    return get_model(MODEL_NAME, exclude=FAST_EXCLUDE, enable=("senter",))
+
+def disabled_components(tasks=ALL_TASKS):
+    """Components of the full pipeline that none of the given tasks need"""
+    needed = set().union(*(TASK_COMPONENTS[task] for task in tasks))
+    return [name for name in get_nlp().pipe_names if name not in needed]
+
+def process_text(text, tasks=ALL_TASKS, fast=False):
+    """Run spaCy over text with only the components the tasks need"""
+    if fast:
+        return get_fast_nlp()(text)
+    return get_nlp()(text, disable=disabled_components(tasks))
+
+def process_texts(texts, tasks=ALL_TASKS, fast=False, batch_size=50, n_process=1):
+    """Stream texts through spaCy with only the components the tasks need"""
+    if fast:
+        return get_fast_nlp().pipe(texts, batch_size=batch_size, n_process=n_process)
+    return get_nlp().pipe(texts, batch_size=batch_size, n_process=n_process, disable=disabled_components(tasks))
+
+# Extraction budgets, so a huge upload cannot tie up a worker. Documents
+# stop being read once either budget is used up; 0 disables a budget.
+MAX_PAGES = int(os.environ.get("EXTRACT_MAX_PAGES", 50))
+MAX_CHARS = int(os.environ.get("EXTRACT_MAX_CHARS", 200000))
+
+def iter_pdf_chunks(pdf_path, max_pages=None):
+    """Yield the text of each PDF page, reading pages only as they are needed"""
+    max_pages = MAX_PAGES if max_pages is None else max_pages
     with open(pdf_path, 'rb') as file:
         pdf_reader = PyPDF2.PdfReader(file)
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-    return text
+        for number, page in enumerate(pdf_reader.pages):
+            if max_pages and number >= max_pages:
+                break
+            yield (page.extract_text() or "") + "\n"
 
-def extract_text_from_docx(docx_path):
-    """Extract text from DOCX file"""
+def iter_docx_chunks(docx_path):
+    """Yield the text of each DOCX paragraph"""
     doc = docx.Document(docx_path)
-    text = ""
     for paragraph in doc.paragraphs:
-        text += paragraph.text + "\n"
-    return text
+        yield paragraph.text + "\n"
 
-def extract_text_from_file(file_path):
-    """Extract text from PDF or DOCX file"""
+def iter_text_chunks(file_path, max_pages=None):
+    """Yield text chunks (pages or paragraphs) of a PDF or DOCX file"""
     file_extension = Path(file_path).suffix.lower()
     
     if file_extension == '.pdf':
-        return extract_text_from_pdf(file_path)
+        return iter_pdf_chunks(file_path, max_pages=max_pages)
     elif file_extension == '.docx':
-        return extract_text_from_docx(file_path)
+        return iter_docx_chunks(file_path)
     else:
         raise ValueError(f"Unsupported file format: {file_extension}")
 
+def join_chunks(chunks, max_chars=None):
+    """Join text chunks once, stopping as soon as the character budget is used up"""
+    max_chars = MAX_CHARS if max_chars is None else max_chars
+    parts = []
+    size = 0
+    for chunk in chunks:
+        if max_chars and size + len(chunk) >= max_chars:
+            parts.append(chunk[:max_chars - size])
+            break
+        parts.append(chunk)
+        size += len(chunk)
+    # Closing the generator releases the file before the rest is read
+    if hasattr(chunks, 'close'):
+        chunks.close()
+    return "".join(parts)
+
+def extract_text_from_pdf(pdf_path, max_pages=None, max_chars=None):
+    """Extract text from PDF file"""
+    return join_chunks(iter_pdf_chunks(pdf_path, max_pages=max_pages), max_chars=max_chars)
+
+def extract_text_from_docx(docx_path, max_chars=None):
+    """Extract text from DOCX file"""
+    return join_chunks(iter_docx_chunks(docx_path), max_chars=max_chars)
+
+def extract_text_from_file(file_path, max_pages=None, max_chars=None):
+    """Extract text from PDF or DOCX file"""
+    return join_chunks(iter_text_chunks(file_path, max_pages=max_pages), max_chars=max_chars)
+
+# Resume section headers, matched against whole lines ignoring case and
+# surrounding punctuation. Lines under an unknown header stay in the
+# section before it.
+SECTION_HEADERS = {
+    "contact": ("contact", "contact details", "contact information", "personal details", "personal information"),
+    "summary": ("summary", "profile", "objective", "about me", "career objective", "professional summary"),
+    "education": ("education", "academic background", "academic qualifications", "qualifications",
+                  "education and training", "training"),
+    "experience": ("experience", "work experience", "professional experience", "employment",
+                   "employment history", "work history", "career history", "internships", "projects"),
+    "skills": ("skills", "technical skills", "key skills", "core competencies", "competencies",
+               "technologies", "tools"),
+    "other": ("certifications", "certificates", "awards", "achievements", "languages", "interests",
+              "hobbies", "publications", "references", "volunteering", "activities"),
+}
+_HEADER_SECTIONS = {header: section for section, headers in SECTION_HEADERS.items() for header in headers}
+HEADER_MAX_LENGTH = 40
+HEADER_PUNCTUATION = " \t:-|#*\u2022"
+
+# Sections whose sentences and entities the extractors need from spaCy;
+# contact details and skill names come from plain text instead
+NLP_SECTIONS = ("education", "experience", "skills")
+
+def segment_sections(text):
+    """Split resume text into ``{section: text}`` at recognised header lines.
+
+    Text before the first header is taken as contact details. Returns None
+    when no header is found, so callers fall back to the whole text.
+    """
+    sections = {}
+    current = "contact"
+    found = False
+    for line in text.splitlines(keepends=True):
+        stripped = line.strip()
+        if stripped and len(stripped) <= HEADER_MAX_LENGTH:
+            header = " ".join(stripped.strip(HEADER_PUNCTUATION).lower().split())
+            section = _HEADER_SECTIONS.get(header)
+            if section is not None:
+                current = section
+                found = True
+                continue
+        sections.setdefault(current, []).append(line)
+    if not found:
+        return None
+    return {section: "".join(lines) for section, lines in sections.items()}
+
+def nlp_input(text, sections=None):
+    """The part of a resume's text that needs to go through spaCy"""
+    if not sections or not any(sections.get(name, "").strip() for name in ("education", "experience")):
+        return text
+    return "\n\n".join(sections[name] for name in NLP_SECTIONS if sections.get(name, "").strip())
+
 def extract_email(text):
     """Extract email from text using regex"""
     email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
@@ -56,150 +185,193 @@ def extract_phone(text):
         return ''.join(phones[0])
     return None
 
+# Adjectives whose head noun is taken as a skill ("database administration")
+TECH_ADJECTIVES = {"technical", "programming", "software", "hardware", "database", "web", "mobile"}
 
-def extract_skills(doc):
-    """Extract skills from spaCy doc"""
-    # Common skill-related keywords
-    skill_patterns = [
-        "experience with", "familiar with", "knowledge of", "skilled in",
-        "proficient in", "expertise in", "competent in", "trained in"
-    ]
-    
-    skills = set()
-    
-    # Extract skills based on patterns
-    for pattern in skill_patterns:
-        pattern_matches = re.finditer(pattern + r"\s([\w\s,]+)", doc.text, re.IGNORECASE)
-        for match in pattern_matches:
-            skill_text = match.group(1).strip()
-            # Split by commas and 'and'
-            for skill in re.split(r',|\sand\s', skill_text):
-                if skill.strip():
-                    skills.add(skill.strip())
-    
-    # Extract technical skills (nouns following technical adjectives)
-    tech_adjectives = ["technical", "programming", "software", "hardware", "database", "web", "mobile"]
-    for token in doc:
-        if token.text.lower() in tech_adjectives and token.head.pos_ == "NOUN":
-            skills.add(token.head.text)
-    
-    # Extract known programming languages, frameworks, etc.
-    tech_skills = [
-        "Python", "Java", "JavaScript", "C++", "C#", "Ruby", "PHP", "Swift",
-        "React", "Angular", "Vue", "Django", "Flask", "Spring", "Node.js",
-        "SQL", "MongoDB", "PostgreSQL", "MySQL", "Oracle", "AWS", "Azure",
-        "Docker", "Kubernetes", "Git", "TensorFlow", "PyTorch", "scikit-learn"
-    ]
-    
-    for skill in tech_skills:
-        if re.search(r'\b' + re.escape(skill) + r'\b', doc.text, re.IGNORECASE):
-            skills.add(skill)
+def extract_skills(doc, text=None):
+    """Extract skills from spaCy doc, plus the full text when the doc only covers part of it"""
+    text = doc.text if text is None else text
+    
+    # Extract skills listed after phrases such as "proficient in"
+    skills = find_phrase_skills(text)
+    
+    # Extract technical skills (nouns following technical adjectives);
+    # only possible when the doc was run through the dependency parser
+    if doc.has_annotation("DEP"):
+        for token in doc:
+            if token.lower_ in TECH_ADJECTIVES and token.head.pos_ == "NOUN":
+                skills.add(token.head.text)
+    
+    # Extract known programming languages, frameworks, etc. (and their synonyms);
+    # matching only needs tokens, so text outside the doc is just tokenized.
+    # The pipeline that made the doc is reused, so fast mode never loads the full one.
+    nlp = model_for_vocab(doc.vocab) or get_nlp()
+    token_doc = doc if text == doc.text else nlp.make_doc(text)
+    skills.update(get_skill_matcher(nlp).find(token_doc))
     
     return list(skills)
 
-def extract_education(doc):
-    """Extract education information from spaCy doc"""
-    education = []
+# Keywords marking sentences about education and about work experience.
+# Both are matched as case-insensitive substrings of a sentence.
+EDUCATION_KEYWORDS = [
+    "Bachelor", "Master", "PhD", "Doctorate", "BSc", "MSc", "BA", "MA",
+    "degree", "university", "college", "school", "institute"
+]
+WORK_KEYWORDS = [
+    "work", "experience", "job", "position", "role", "employment",
+    "worked", "employed", "hired", "manager", "director", "engineer",
+    "developer", "analyst", "consultant", "intern"
+]
+
+YEAR_PATTERN = re.compile(r'\b(19|20)\d{2}\b')
+# Job titles are taken to be capitalized two-word phrases
+JOB_TITLE_PATTERN = re.compile(r'\b[A-Z][a-z]+ [A-Z][a-z]+\b')
+
+class KeywordClassifier:
+    """Finds which keyword families occur in a text with a single regex scan.
+
+    All keywords go into one precompiled alternation inside a lookahead, so
+    a match is found at every position a keyword starts. Each keyword also
+    counts for the families of the keywords it contains ("ma" in "manager"),
+    which gives the same answer as testing every keyword as a substring.
+    """
     
-    # Common education keywords
-    edu_keywords = [
-        "Bachelor", "Master", "PhD", "Doctorate", "BSc", "MSc", "BA", "MA",
-        "degree", "university", "college", "school", "institute"
-    ]
+    def __init__(self, families):
+        keywords = {}
+        for family, words in families.items():
+            for word in words:
+                keywords.setdefault(word.lower(), set()).add(family)
+        
+        self.families = frozenset(families)
+        self._families = {
+            word: frozenset().union(*(found for other, found in keywords.items() if other in word))
+            for word in keywords
+        }
+        # Longest first, so the match at each position is the longest keyword there
+        alternation = "|".join(re.escape(word) for word in sorted(keywords, key=len, reverse=True))
+        self._pattern = re.compile(f"(?=({alternation}))")
+    
+    def classify(self, text):
+        """Set of the families with a keyword somewhere in the text"""
+        found = set()
+        for match in self._pattern.finditer(text.lower()):
+            found |= self._families[match.group(1)]
+            if found == self.families:
+                break
+        return found
+
+SENTENCE_CLASSIFIER = KeywordClassifier({"education": EDUCATION_KEYWORDS, "experience": WORK_KEYWORDS})
+
+def extract_education_and_experience(doc):
+    """Extract education and work experience from spaCy doc in one pass over its sentences"""
+    education = []
+    experience = []
     
-    # Find sentences containing education keywords
     for sent in doc.sents:
-        if any(keyword.lower() in sent.text.lower() for keyword in edu_keywords):
+        text = sent.text
+        families = SENTENCE_CLASSIFIER.classify(text)
+        if not families:
+            continue
+        
+        # Years (graduation or employment) are shared by both sections
+        years = YEAR_PATTERN.findall(text)
+        ents = sent.ents
+        
+        if "education" in families:
             # Extract entities that might be institutions
-            institutions = [ent.text for ent in sent.ents if ent.label_ in ["ORG", "GPE"]]
-            
-            # Extract years (could be graduation years)
-            years = re.findall(r'\b(19|20)\d{2}\b', sent.text)
-            
+            institutions = [ent.text for ent in ents if ent.label_ in ("ORG", "GPE")]
             if institutions or years:
                 education.append({
-                    "text": sent.text.strip(),
+                    "text": text.strip(),
                     "institutions": institutions,
                     "years": years
                 })
-    
-    return education
-
-def extract_experience(doc):
-    """Extract work experience from spaCy doc"""
-    experience = []
-    
-    # Common work experience keywords
-    work_keywords = [
-        "work", "experience", "job", "position", "role", "employment",
-        "worked", "employed", "hired", "manager", "director", "engineer",
-        "developer", "analyst", "consultant", "intern"
-    ]
-    
-    # Find sentences containing work keywords
-    for sent in doc.sents:
-        if any(keyword.lower() in sent.text.lower() for keyword in work_keywords):
-            # Extract organizations
-            organizations = [ent.text for ent in sent.ents if ent.label_ == "ORG"]
-            
-            # Extract years
-            years = re.findall(r'\b(19|20)\d{2}\b', sent.text)
-            
-            # Extract job titles (capitalized phrases)
-            job_titles = re.findall(r'\b[A-Z][a-z]+ [A-Z][a-z]+\b', sent.text)
-            
+        
+        if "experience" in families:
+            organizations = [ent.text for ent in ents if ent.label_ == "ORG"]
+            job_titles = JOB_TITLE_PATTERN.findall(text)
             if organizations or years or job_titles:
                 experience.append({
-                    "text": sent.text.strip(),
+                    "text": text.strip(),
                     "organizations": organizations,
-                    "years": years,
+                    "years": list(years),
                     "job_titles": job_titles
                 })
     
-    return experience
+    return education, experience
+
+def extract_education(doc):
+    """Extract education information from spaCy doc"""
+    return extract_education_and_experience(doc)[0]
+
+def extract_experience(doc):
+    """Extract work experience from spaCy doc"""
+    return extract_education_and_experience(doc)[1]
+
+def parser_version(fast=False):
+    """Version tag of the parsed output, including the settings and skills dictionary that change it"""
+    mode = "fast" if fast else "full"
+    return f"{PARSER_VERSION}:{MODEL_NAME}:{mode}:{MAX_PAGES}:{MAX_CHARS}:{dictionary_version()}"
 
-def parse_resume(file_path):
+def parse_resume(file_path, fast=False):
     """Parse resume file and extract structured information"""
     # Extract text from file
     text = extract_text_from_file(file_path)
     
-    # Process with spaCy
-    doc = nlp(text)
+    # Process only the sections that need spaCy
+    sections = segment_sections(text)
+    doc = process_text(nlp_input(text, sections), fast=fast)
+    
+    return build_resume_data(text, doc, sections)
+
+def parse_resume_texts(texts, batch_size=50, n_process=1, fast=False):
+    """Parse many resume texts at once, streaming them through nlp.pipe"""
+    sections = [segment_sections(text) for text in texts]
+    inputs = [nlp_input(text, text_sections) for text, text_sections in zip(texts, sections)]
+    docs = process_texts(inputs, fast=fast, batch_size=batch_size, n_process=n_process)
+    for text, text_sections, doc in zip(texts, sections, docs):
+        yield build_resume_data(text, doc, text_sections)
+
+def build_resume_data(text, doc, sections=None):
+    """Extract structured resume information from text and its spaCy doc.
+
+    ``doc`` may cover only the sections picked by ``nlp_input``; contact
+    details are looked for in the contact section before the whole text.
+    """
+    contact = sections.get("contact", "") if sections else ""
     
     # Extract information
-    email = extract_email(text)
-    phone = extract_phone(text)
-    skills = extract_skills(doc)
-    education = extract_education(doc)
-    experience = extract_experience(doc)
+    email = extract_email(contact) or extract_email(text)
+    phone = extract_phone(contact) or extract_phone(text)
+    skills = extract_skills(doc, text)
+    education, experience = extract_education_and_experience(doc)
     
     # Return structured data
     return {
         "email": email,
         "phone": phone,
         "skills": skills,
+        "skill_keys": normalize_skills(skills),
         "education": education,
         "experience": experience,
         "full_text": text
     }
 
-def parse_job_description(text):
+def parse_job_description(text, fast=False):
     """Parse job description text and extract structured information"""
     # Process with spaCy
-    doc = nlp(text)
+    doc = process_text(text, fast=fast)
     
     # Extract skills
     skills = extract_skills(doc)
     
-    # Extract education requirements
-    education = extract_education(doc)
-    
-    # Extract experience requirements
-    experience = extract_experience(doc)
+    # Extract education and experience requirements
+    education, experience = extract_education_and_experience(doc)
     
     # Return structured data
     return {
         "skills": skills,
+        "skill_keys": normalize_skills(skills),
         "education": education,
         "experience": experience,
         "full_text": text
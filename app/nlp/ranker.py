@@ -1,106 +1,406 @@
 from app.models.resume import Resume
 from app.models.job_description import JobDescription
-from app.nlp.vectorizer import ResumeVectorizer
-from bson.objectid import ObjectId
-from app import mongo
+from app.nlp.vectorizer import get_vectorizer
+from app.nlp.storage import has_vector
+from app.models.user import User
+from flask import current_app
+from app.nlp.matrix import VectorMatrix, top_k_indices
+from app.nlp.scoring import SCORING_FEATURES, hybrid_scores, is_similarity_only, job_requirements, resolve_weights
+from app.nlp.retrieval import recall_audit
+from app.nlp.skills import match_skills, skill_keys, unique_skills
+from app import ann_index, job_index, ranking_cache, resume_features, resume_index
+import numpy as np
+import random
 
 class ResumeRanker:
-    def __init__(self, vectorizer_method="tfidf"):
-        self.vectorizer = ResumeVectorizer(method=vectorizer_method)
+    def __init__(self, vectorizer_method=None, ann_effort=None, ann_candidates=None, shortlist_size=None):
+        # Shared instance; ranking never touches the TF-IDF model itself
+        self.vectorizer = get_vectorizer(vectorizer_method)
+        # Recall/latency trade-off of the approximate index for dense
+        # embeddings: probed IVF buckets or HNSW ``ef``, and how many
+        # nearest neighbours it returns (see ANN_SEARCH_EFFORT / ANN_CANDIDATES)
+        self.ann_effort = ann_effort
+        self.ann_candidates = ann_candidates
+        # Two-stage retrieval: how many resumes the inverted-index prefilter
+        # passes on to exact scoring (see SHORTLIST_SIZE; 0 scores everyone)
+        self.shortlist_size = shortlist_size
     
-    def rank_resumes_for_job(self, job_description_id):
+    # Fields of the job description needed to rank resumes against it
+    JD_RANKING_PROJECTION = {
+        'vector': 1, 'vector_model': 1, 'updated_at': 1, 'scoring_weights': 1,
+        'parsed_data.skills': 1, 'parsed_data.education': 1, 'parsed_data.experience': 1
+    }
+    
+    # Fields of a resume needed to compare its skills with a job's
+    RESUME_SKILLS_PROJECTION = {'user_id': 1, 'parsed_data.skills': 1, 'parsed_data.skill_keys': 1}
+    
+    def rank_resumes_for_job(self, job_description_id, top_k=None):
         """Rank all resumes for a specific job description"""
         # Get job description
-        jd = JobDescription.get_by_id(job_description_id)
-        if not jd:
+        jd = JobDescription.get_by_id(job_description_id, self.JD_RANKING_PROJECTION)
+        if not jd or not has_vector(jd.vector):
             return []
         
-        # Get all resumes
-        resumes = Resume.get_all()
+        resume_ids, scores, similarities = self._ranked_order(jd)
+        return self._build_entries(jd, resume_ids[:top_k], scores[:top_k], similarities[:top_k])
+    
+    def rank_resumes_page(self, job_description_id, limit=25, offset=0, min_score=None):
+        """One page of the ranking for a job, plus the totals needed to page through it"""
+        page = {
+            'results': [], 'total': 0, 'offset': offset, 'limit': limit, 'next_offset': None,
+            'candidate_limit': None
+        }
         
-        # Calculate similarity scores
-        ranked_resumes = []
-        for resume in resumes:
-            # Skip if no vector
-            if not resume.vector or not jd.vector:
-                continue
-            
-            # Calculate similarity score
-            similarity = self.vectorizer.compute_similarity(resume.vector, jd.vector)
-            
-            # Get matching and missing skills
-            matching_skills, missing_skills = self.vectorizer.get_matching_skills(
-                resume.parsed_data.get('skills', []),
-                jd.parsed_data.get('skills', [])
+        jd = JobDescription.get_by_id(job_description_id, self.JD_RANKING_PROJECTION)
+        if not jd or not has_vector(jd.vector):
+            return page
+        
+        resume_ids, scores, similarities = self._ranked_order(jd)
+        
+        # Scores are sorted, so the threshold just cuts off the tail
+        total = len(resume_ids) if min_score is None else int(np.count_nonzero(scores >= min_score))
+        end = min(offset + limit, total)
+        
+        page['results'] = self._build_entries(
+            jd, resume_ids[offset:end], scores[offset:end], similarities[offset:end]
+        )
+        page['total'] = total
+        if end < total:
+            page['next_offset'] = end
+        # The approximate index only returns the nearest resumes, so the
+        # ranking (and its total) stops there
+        if ann_index.supports(jd.vector_model):
+            page['candidate_limit'] = self._ann_candidates()
+        return page
+    
+    def iter_ranked_resumes(self, job_description_id, min_score=None, chunk_size=500):
+        """Yield every ranked resume for a job, building entries one chunk at a time"""
+        jd = JobDescription.get_by_id(job_description_id, self.JD_RANKING_PROJECTION)
+        if not jd or not has_vector(jd.vector):
+            return
+        
+        resume_ids, scores, similarities = self._ranked_order(jd)
+        total = len(resume_ids) if min_score is None else int(np.count_nonzero(scores >= min_score))
+        
+        for start in range(0, total, chunk_size):
+            end = min(start + chunk_size, total)
+            yield from self._build_entries(
+                jd, resume_ids[start:end], scores[start:end], similarities[start:end]
             )
-            
-            # Get user info
-            user_data = mongo.db.users.find_one({"_id": ObjectId(resume.user_id)})
-            user_name = user_data.get('name', 'Unknown') if user_data else 'Unknown'
-            
+    
+    def _ranked_order(self, jd):
+        """All comparable resume IDs with their ranking scores and vector similarities, best first"""
+        weights = resolve_weights(jd.scoring_weights, current_app.config.get("HYBRID_WEIGHTS"))
+        use_ann = ann_index.supports(jd.vector_model)
+        if use_ann:
+            effort = self.ann_effort or ann_index.default_effort
+            candidates = self._ann_candidates()
+        else:
+            shortlist_size = self._shortlist_size()
+        
+        # The in-process indexes only poll for changes every few seconds, so
+        # catch them up before tagging the result with the current generation
+        generation = Resume.generation()
+        resume_index.sync(generation)
+        resume_features.sync(generation)
+        if use_ann:
+            ann_index.sync(generation)
+        
+        # Reuse the previous ordering while neither the job nor any resume changed
+        cache_key = (jd.vector_model, jd.updated_at, generation, tuple(weights[name] for name in SCORING_FEATURES))
+        if use_ann:
+            cache_key += ('ann', effort, candidates)
+        elif shortlist_size:
+            cache_key += ('shortlist', shortlist_size)
+        cached = ranking_cache.get_job(jd.id, cache_key)
+        if cached is not None:
+            return cached
+        
+        if use_ann:
+            # Dense embeddings: only the approximate nearest neighbours are ranked
+            resume_ids, similarities = ann_index.search(jd.vector, candidates, effort=effort)
+            # The ANN index is never pruned; drop resumes the vector index no longer has
+            indexed = resume_index.positions(resume_ids)
+            if len(indexed) < len(resume_ids):
+                keep = [i for i, resume_id in enumerate(resume_ids) if resume_id in indexed]
+                resume_ids, similarities = [resume_ids[i] for i in keep], similarities[keep]
+        elif shortlist_size:
+            resume_ids, similarities = self._shortlisted_order(jd, shortlist_size)
+        else:
+            resume_ids, similarities = self._similarity_order(jd)
+        
+        if is_similarity_only(weights):
+            order = (resume_ids, similarities, similarities)
+        else:
+            order = self._hybrid_order(jd, resume_ids, similarities, weights)
+        
+        ranking_cache.set_job(jd.id, cache_key, order)
+        return order
+    
+    def _ann_candidates(self):
+        return self.ann_candidates or current_app.config.get("ANN_CANDIDATES", 1000)
+    
+    def _shortlist_size(self):
+        if self.shortlist_size is not None:
+            return self.shortlist_size
+        return current_app.config.get("SHORTLIST_SIZE", 0)
+    
+    def _shortlist(self, jd, size):
+        """Index rows of the resumes most likely to match, found through the inverted indexes"""
+        # Stage one: resumes sharing the job's key terms or skills, scored
+        # only by how much they share, without touching any other resume
+        scores = resume_index.term_postings().candidates(jd.vector)
+        
+        jd_keys = [key for _, key in unique_skills(jd.parsed_data.get('skills', []))]
+        if jd_keys:
+            skill_counts = resume_features.skill_candidates(jd_keys)
+            for resume_id, position in resume_index.positions(skill_counts).items():
+                scores[position] = scores.get(position, 0.0) + skill_counts[resume_id] / len(jd_keys)
+        
+        if not scores:
+            return np.empty(0, dtype=np.int64)
+        positions = np.fromiter(scores.keys(), dtype=np.int64, count=len(scores))
+        weights = np.fromiter(scores.values(), dtype=np.float32, count=len(scores))
+        
+        # Only vectors produced by the job's model are comparable with it,
+        # so the others must not take places on the shortlist
+        comparable = resume_index.version_mask(positions, jd.vector_model)
+        if not comparable.all():
+            self._warn_incomparable(jd, int(np.count_nonzero(~comparable)))
+            positions, weights = positions[comparable], weights[comparable]
+        return np.sort(positions[top_k_indices(weights, size)])
+    
+    def _shortlisted_order(self, jd, size):
+        """Like ``_similarity_order``, but only the shortlisted resumes are scored exactly"""
+        if resume_index.dimension != len(jd.vector):
+            return [], np.empty(0, dtype=np.float32)
+        
+        order = resume_index.rows(self._shortlist(jd, size)).top_k(jd.vector, version=jd.vector_model)
+        
+        # Now and then, compare with the full ranking to measure the recall lost
+        audit_rate = current_app.config.get("SHORTLIST_AUDIT_RATE", 0.0)
+        if audit_rate and random.random() < audit_rate:
+            k = current_app.config.get("SHORTLIST_AUDIT_K", 50)
+            full_ids, _ = self._similarity_order(jd, k)
+            recall = recall_audit.record(order[0][:k], full_ids)
+            if recall is not None:
+                current_app.logger.info("Shortlist recall@%d for job %s: %.3f", k, jd.id, recall)
+        return order
+    
+    def _similarity_order(self, jd, top_k=None):
+        """Comparable resume IDs and their vector similarity to a job, best first"""
+        # Score every indexed resume with a single matrix-vector product
+        matrix = resume_index.matrix()
+        if matrix.dimension != len(jd.vector):
+            return [], np.empty(0, dtype=np.float32)
+        
+        # Only vectors produced by the job's model are comparable with it
+        comparable = matrix.rows_for_version(jd.vector_model)
+        if len(comparable) < len(matrix):
+            self._warn_incomparable(jd, len(matrix) - len(comparable))
+        return matrix.top_k(jd.vector, top_k, version=jd.vector_model)
+    
+    def _warn_incomparable(self, jd, skipped):
+        current_app.logger.warning(
+            "Skipping %d resumes vectorized with a different model than job %s (%s); "
+            "run 'flask fit-vectorizer' to re-vectorize them",
+            skipped, jd.id, jd.vector_model
+        )
+    
+    def _hybrid_order(self, jd, resume_ids, similarities, weights):
+        """Re-rank candidates by the weighted combination of all scoring signals"""
+        requirements = job_requirements(jd.parsed_data)
+        jd_keys = [key for _, key in unique_skills(requirements['skills'])]
+        
+        # Every signal is one array operation over the precomputed feature columns
+        columns = resume_features.columns(resume_ids)
+        scores = hybrid_scores(similarities, columns, requirements, jd_keys, weights)
+        
+        order = top_k_indices(scores)
+        return [resume_ids[i] for i in order], scores[order], np.asarray(similarities)[order]
+    
+    def _build_entries(self, jd, resume_ids, scores, similarities):
+        """Result entries for the given candidates, in the given order"""
+        # Only the selected candidates' metadata is read from MongoDB
+        scores = dict(zip(resume_ids, scores))
+        similarities = dict(zip(resume_ids, similarities))
+        resumes = Resume.get_many(resume_ids, self.RESUME_SKILLS_PROJECTION)
+        skill_matches = self._skill_matches(jd.parsed_data.get('skills', []), resumes)
+        
+        # Resolve applicant names for the whole candidate set at once
+        user_names = User.get_names(resume.user_id for resume in resumes)
+        
+        ranked_resumes = []
+        for resume, (matching_skills, missing_skills, percentage) in zip(resumes, skill_matches):
             ranked_resumes.append({
                 'resume_id': resume.id,
                 'user_id': resume.user_id,
-                'user_name': user_name,
-                'similarity_score': similarity,
+                'user_name': user_names.get(resume.user_id, 'Unknown'),
+                'score': float(scores[resume.id]),
+                'similarity_score': float(similarities[resume.id]),
                 'matching_skills': matching_skills,
                 'missing_skills': missing_skills,
-                'skills_match_percentage': len(matching_skills) / len(jd.parsed_data.get('skills', [])) * 100 if jd.parsed_data.get('skills', []) else 0
+                'skills_match_percentage': percentage
             })
         
-        # Sort by similarity score (descending)
-        ranked_resumes.sort(key=lambda x: x['similarity_score'], reverse=True)
-        
         return ranked_resumes
     
+    def _skill_matches(self, jd_skills, resumes):
+        """``(matching, missing, percentage)`` of the job's skills for each resume"""
+        jd_skills = unique_skills(jd_skills)
+        if not jd_skills:
+            return [([], [], 0) for _ in resumes]
+        
+        matches = []
+        for resume in resumes:
+            keys = set(skill_keys(resume.parsed_data))
+            matching_skills = [skill for skill, key in jd_skills if key in keys]
+            missing_skills = [skill for skill, key in jd_skills if key not in keys]
+            matches.append((matching_skills, missing_skills, len(matching_skills) / len(jd_skills) * 100))
+        return matches
+    
+    # Fields of the resume needed to rank job descriptions against it
+    RESUME_MATCHING_PROJECTION = {
+        'vector': 1, 'vector_model': 1, 'updated_at': 1, 'parsed_data.skills': 1, 'parsed_data.skill_keys': 1
+    }
+    
+    def rank_jobs_for_resume(self, resume_id, top_k=10):
+        """The job descriptions that best match a resume, best first"""
+        resume = Resume.get_by_id(resume_id, self.RESUME_MATCHING_PROJECTION)
+        if not resume or not has_vector(resume.vector):
+            return []
+        
+        # Rankings for a resume go stale when it or any job description changes
+        generation = JobDescription.generation()
+        job_index.sync(generation)
+        cache_key = (resume.vector_model, resume.updated_at, generation, top_k)
+        order = ranking_cache.get_resume(resume.id, cache_key)
+        if order is None:
+            # Score every indexed job description with a single matrix-vector product
+            matrix = job_index.matrix()
+            if matrix.dimension != len(resume.vector):
+                order = ([], np.empty(0, dtype=np.float32))
+            else:
+                order = matrix.top_k(resume.vector, top_k, version=resume.vector_model)
+            ranking_cache.set_resume(resume.id, cache_key, order)
+        
+        jd_ids, scores = order
+        jds = {
+            jd.id: jd for jd in JobDescription.get_many(
+                jd_ids, {'title': 1, 'company': 1, 'parsed_data.skills': 1}
+            )
+        }
+        resume_keys = set(skill_keys(resume.parsed_data))
+        
+        matches = []
+        for jd_id, similarity in zip(jd_ids, scores):
+            jd = jds.get(jd_id)
+            if jd is None:
+                continue
+            
+            matching_skills, missing_skills = match_skills(jd.parsed_data.get('skills', []), resume_keys)
+            jd_skill_count = len(matching_skills) + len(missing_skills)
+            
+            matches.append({
+                'job_description_id': jd.id,
+                'title': jd.title,
+                'company': jd.company,
+                'similarity_score': float(similarity),
+                'matching_skills': matching_skills,
+                'missing_skills': missing_skills,
+                'skills_match_percentage': len(matching_skills) / jd_skill_count * 100 if jd_skill_count else 0
+            })
+        
+        return matches
+    
+    # Fields of a candidate resume needed for insights
+    RESUME_INSIGHTS_PROJECTION = {
+        'user_id': 1, 'vector': 1, 'vector_model': 1, 'parsed_data.skills': 1,
+        'parsed_data.skill_keys': 1, 'parsed_data.education': 1, 'parsed_data.experience': 1
+    }
+    
     def get_resume_insights(self, resume_id, job_description_id):
         """Get detailed insights for a specific resume and job description"""
-        # Get resume and job description
-        resume = Resume.get_by_id(resume_id)
-        jd = JobDescription.get_by_id(job_description_id)
+        insights = self.get_insights_batch(job_description_id, [resume_id])
+        return insights[0] if insights else None
+    
+    def get_top_candidate_insights(self, job_description_id, top_k=50):
+        """Insights for the best ranked resumes of a job, best first"""
+        jd = JobDescription.get_by_id(job_description_id, self.JD_RANKING_PROJECTION)
+        if not jd or not has_vector(jd.vector):
+            return []
         
-        if not resume or not jd:
-            return None
+        resume_ids, _, _ = self._ranked_order(jd)
+        return self.get_insights_batch(job_description_id, resume_ids[:top_k], jd=jd)
+    
+    # Fields of the job description needed for insights
+    JD_INSIGHTS_PROJECTION = {
+        'vector': 1, 'vector_model': 1,
+        'parsed_data.skills': 1, 'parsed_data.education': 1, 'parsed_data.experience': 1
+    }
+    
+    def get_insights_batch(self, job_description_id, resume_ids, jd=None):
+        """Insights for several resumes against one job description, in the given order.
         
-        # Calculate similarity score
-        similarity = self.vectorizer.compute_similarity(resume.vector, jd.vector)
+        ``jd`` may be passed when the caller already loaded the job description
+        with at least ``JD_INSIGHTS_PROJECTION``.
+        """
+        if jd is None:
+            jd = JobDescription.get_by_id(job_description_id, self.JD_INSIGHTS_PROJECTION)
+        if not jd:
+            return []
         
-        # Get matching and missing skills
-        matching_skills, missing_skills = self.vectorizer.get_matching_skills(
-            resume.parsed_data.get('skills', []),
-            jd.parsed_data.get('skills', [])
-        )
+        # Everything derived from the job description is computed once
+        requirements = job_requirements(jd.parsed_data)
+        resumes = Resume.get_many(resume_ids, self.RESUME_INSIGHTS_PROJECTION)
         
-        # Calculate skill match percentage
-        skills_match_percentage = len(matching_skills) / len(jd.parsed_data.get('skills', [])) * 100 if jd.parsed_data.get('skills', []) else 0
+        # Score every comparable resume against the job with one matrix product
+        comparable = [
+            resume for resume in resumes
+            if resume.vector_model == jd.vector_model and has_vector(resume.vector)
+            and has_vector(jd.vector) and len(resume.vector) == len(jd.vector)
+        ]
+        similarities = {}
+        if comparable:
+            matrix = VectorMatrix.from_vectors(
+                [resume.id for resume in comparable],
+                [resume.vector for resume in comparable],
+                use_sparse=False
+            )
+            similarities = dict(zip(matrix.ids, matrix.score(jd.vector).tolist()))
         
-        # Get education match
-        education_match = self._evaluate_education_match(
-            resume.parsed_data.get('education', []),
-            jd.parsed_data.get('education', [])
-        )
+        user_names = User.get_names(resume.user_id for resume in resumes)
+        skill_matches = self._skill_matches(requirements['skills'], resumes)
         
-        # Get experience match
-        experience_match = self._evaluate_experience_match(
-            resume.parsed_data.get('experience', []),
-            jd.parsed_data.get('experience', [])
-        )
+        insights = []
+        for resume, (matching_skills, missing_skills, percentage) in zip(resumes, skill_matches):
+            insights.append({
+                'resume_id': resume.id,
+                'user_id': resume.user_id,
+                'user_name': user_names.get(resume.user_id, 'Unknown'),
+                'similarity_score': similarities.get(resume.id, 0.0),
+                'matching_skills': matching_skills,
+                'missing_skills': missing_skills,
+                'skills_match_percentage': percentage,
+                'education_match': self._match_education(
+                    resume.parsed_data.get('education', []), requirements
+                ),
+                'experience_match': self._match_experience(
+                    resume.parsed_data.get('experience', []), requirements
+                )
+            })
         
-        return {
-            'similarity_score': similarity,
-            'matching_skills': matching_skills,
-            'missing_skills': missing_skills,
-            'skills_match_percentage': skills_match_percentage,
-            'education_match': education_match,
-            'experience_match': experience_match
-        }
+        return insights
     
     def _evaluate_education_match(self, resume_education, jd_education):
         """Evaluate how well the resume's education matches job requirements"""
+        return self._match_education(resume_education, job_requirements({'education': jd_education}))
+    
+    def _match_education(self, resume_education, requirements):
         # This is a simplified implementation
         # In a real system, you would use more sophisticated NLP techniques
         
-        if not jd_education:
+        if not requirements['has_education']:
             return {'match': True, 'score': 1.0, 'details': 'No specific education requirements'}
         
         if not resume_education:
@@ -108,12 +408,9 @@ class ResumeRanker:
         
         # Check for degree keywords in both
         resume_edu_text = ' '.join([edu.get('text', '') for edu in resume_education]).lower()
-        jd_edu_text = ' '.join([edu.get('text', '') for edu in jd_education]).lower()
         
-        degree_keywords = ['bachelor', 'master', 'phd', 'doctorate', 'bsc', 'msc', 'ba', 'ma']
-        
-        for keyword in degree_keywords:
-            if keyword in jd_edu_text and keyword in resume_edu_text:
+        for keyword in requirements['degrees']:
+            if keyword in resume_edu_text:
                 return {'match': True, 'score': 1.0, 'details': f'Found matching {keyword} degree'}
         
         # If no direct match, give partial score
@@ -121,24 +418,19 @@ class ResumeRanker:
     
     def _evaluate_experience_match(self, resume_experience, jd_experience):
         """Evaluate how well the resume's experience matches job requirements"""
+        return self._match_experience(resume_experience, job_requirements({'experience': jd_experience}))
+    
+    def _match_experience(self, resume_experience, requirements):
         # This is a simplified implementation
         
-        if not jd_experience:
+        if not requirements['has_experience']:
             return {'match': True, 'score': 1.0, 'details': 'No specific experience requirements'}
         
         if not resume_experience:
             return {'match': False, 'score': 0.0, 'details': 'No experience information provided'}
         
-        # Extract years of experience from job description
-        import re
-        
-        jd_exp_text = ' '.join([exp.get('text', '') for exp in jd_experience])
-        years_pattern = r'(\d+)[\+]?\s+years?'
-        years_match = re.search(years_pattern, jd_exp_text)
-        
-        if years_match:
-            required_years = int(years_match.group(1))
-            
+        required_years = requirements['required_years']
+        if required_years is not None:
             # Estimate years from resume (very simplified)
             resume_years = len(resume_experience)
             
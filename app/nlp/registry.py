@@ -0,0 +1,66 @@
+import gc
+import os
+import threading
+
+import spacy
+
+# One loaded pipeline per (model, exclude, enable) combination, shared by
+# the parser and the vectorizer for the lifetime of the process
+_models = {}
+_lock = threading.Lock()
+
+def _load(name, exclude):
+    try:
+        return spacy.load(name, exclude=list(exclude))
+    except OSError:
+        if os.environ.get("SPACY_AUTO_DOWNLOAD", "false").lower() not in ("1", "true", "yes"):
+            raise OSError(
+                f"spaCy model '{name}' is not installed. "
+                f"Run 'python -m spacy download {name}' or set SPACY_AUTO_DOWNLOAD=1."
+            )
+        from spacy.cli import download
+        download(name)
+        return spacy.load(name, exclude=list(exclude))
+
+def get_model(name, exclude=(), enable=()):
+    """Return the shared pipeline for a model, loading it on first use.
+
+    ``exclude`` components are not loaded at all; ``enable`` switches on
+    components that the model ships disabled (such as ``senter``).
+    """
+    key = (name, tuple(sorted(exclude)), tuple(sorted(enable)))
+    model = _models.get(key)
+    if model is not None:
+        return model
+    
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            model = _load(name, exclude)
+            for component in enable:
+                if component in model.disabled:
+                    model.enable_pipe(component)
+            _models[key] = model
+    return model
+
+def model_for_vocab(vocab):
+    """The loaded pipeline a doc's vocab belongs to, if any"""
+    for model in list(_models.values()):
+        if model.vocab is vocab:
+            return model
+    return None
+
+def preload_models(names):
+    """Load models up front, e.g. in a gunicorn master before it forks.
+
+    Freezing the garbage collector afterwards keeps the model objects out
+    of future collections, so forked workers keep sharing their pages
+    copy-on-write instead of touching (and copying) them.
+    """
+    for name in names:
+        get_model(name)
+    gc.freeze()
+
+def loaded_models():
+    """Names of the pipelines loaded in this process"""
+    return sorted({key[0] for key in _models})
@@ -0,0 +1,106 @@
+import threading
+
+import numpy as np
+from scipy import sparse
+
+# Heaviest terms of each resume vector kept in the term postings
+KEY_TERMS = 32
+
+def top_terms(vector, k=KEY_TERMS):
+    """Dimensions of the k largest positive weights of a vector"""
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    positive = np.count_nonzero(vector > 0)
+    if not positive:
+        return np.empty(0, dtype=np.int64)
+    k = min(k, positive)
+    return np.argpartition(-vector, k - 1)[:k]
+
+def top_sparse_terms(indices, values, k=KEY_TERMS):
+    """``top_terms`` of a sparse row given as its non-zero indices and values"""
+    positive = values > 0
+    indices, values = indices[positive], values[positive]
+    if not len(values):
+        return np.empty(0, dtype=np.int64)
+    k = min(k, len(values))
+    return indices[np.argpartition(-values, k - 1)[:k]].astype(np.int64)
+
+class TermPostings:
+    """Inverted index from vector dimensions (TF-IDF terms) to index rows.
+
+    Each row is only posted under its ``KEY_TERMS`` heaviest terms, which
+    keeps the postings small and lets a query touch just the rows that
+    share one of its own key terms.
+    """
+
+    def __init__(self, key_terms=KEY_TERMS):
+        self.key_terms = key_terms
+        self._postings = {}
+        self._row_terms = {}
+        self._lock = threading.Lock()
+
+    def build(self, vectors, batch_size=4096):
+        """Post every row of a dense or CSR matrix, a batch of rows at a time"""
+        if sparse.issparse(vectors):
+            vectors = vectors.tocsr()
+            for position in range(vectors.shape[0]):
+                start, end = vectors.indptr[position], vectors.indptr[position + 1]
+                self._post(position, top_sparse_terms(
+                    vectors.indices[start:end], vectors.data[start:end], self.key_terms
+                ))
+            return
+        for start in range(0, vectors.shape[0], batch_size):
+            batch = np.asarray(vectors[start:start + batch_size])
+            for offset, row in enumerate(batch):
+                self.update(start + offset, row)
+
+    def update(self, position, row):
+        self._post(position, top_terms(row, self.key_terms))
+
+    def _post(self, position, terms):
+        with self._lock:
+            for term in self._row_terms.get(position, ()):
+                self._postings[term].discard(position)
+            for term in terms.tolist():
+                self._postings.setdefault(term, set()).add(position)
+            self._row_terms[position] = terms.tolist()
+
+    def candidates(self, query, k=KEY_TERMS):
+        """``{position: score}`` of rows sharing key terms with a query vector"""
+        query = np.asarray(query, dtype=np.float32).ravel()
+        scores = {}
+        with self._lock:
+            for term in top_terms(query, k).tolist():
+                weight = float(query[term])
+                for position in self._postings.get(term, ()):
+                    scores[position] = scores.get(position, 0.0) + weight
+        return scores
+
+class RecallAudit:
+    """Running recall@k of shortlisted rankings measured against full rankings"""
+
+    def __init__(self):
+        self.audits = 0
+        self.recall_sum = 0.0
+        self.worst = None
+        self._lock = threading.Lock()
+
+    def record(self, shortlisted_ids, full_ids):
+        if not len(full_ids):
+            return
+        recall = len(set(shortlisted_ids) & set(full_ids)) / len(full_ids)
+        with self._lock:
+            self.audits += 1
+            self.recall_sum += recall
+            self.worst = recall if self.worst is None else min(self.worst, recall)
+        return recall
+
+    def stats(self):
+        mean = self.recall_sum / self.audits if self.audits else None
+        return {
+            'audits': self.audits,
+            'mean_recall': mean,
+            'mean_recall_loss': 1.0 - mean if mean is not None else None,
+            'worst_recall': self.worst,
+        }
+
+recall_audit = RecallAudit()
@@ -0,0 +1,264 @@
+import re
+import threading
+import time
+
+import numpy as np
+
+from app.nlp.index import advance_sync, poll_since
+from app.nlp.skills import overlap_counts, skill_keys, skill_matrix, vocabulary
+
+# Signals combined into a resume's ranking score
+SCORING_FEATURES = ('similarity', 'skills', 'education', 'experience')
+
+# Pure vector similarity, i.e. the ranking order before hybrid scoring
+DEFAULT_WEIGHTS = {'similarity': 1.0, 'skills': 0.0, 'education': 0.0, 'experience': 0.0}
+
+# Years of experience asked for in a job description, e.g. "5+ years"
+YEARS_PATTERN = re.compile(r'(\d+)[\+]?\s+years?')
+
+DEGREE_KEYWORDS = ('bachelor', 'master', 'phd', 'doctorate', 'bsc', 'msc', 'ba', 'ma')
+
+def parse_weights(value):
+    """Parse ``"similarity=0.6,skills=0.3"`` into a weights dict"""
+    weights = dict.fromkeys(SCORING_FEATURES, 0.0)
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in weights:
+            raise ValueError(f"Unknown scoring feature '{name}'")
+        weights[name] = float(weight)
+    return weights
+
+def resolve_weights(job_weights, default_weights=None):
+    """A job's own weights, falling back to the configured defaults feature by feature"""
+    weights = dict(default_weights or DEFAULT_WEIGHTS)
+    for name, weight in (job_weights or {}).items():
+        if name in weights and weight is not None:
+            weights[name] = float(weight)
+    if sum(weights.values()) <= 0:
+        return dict(DEFAULT_WEIGHTS)
+    return weights
+
+def is_similarity_only(weights):
+    return all(weights[name] == 0 for name in SCORING_FEATURES if name != 'similarity')
+
+def job_requirements(jd_data):
+    """Skills, degrees and required years of a job description, parsed once"""
+    jd_education = jd_data.get('education', [])
+    jd_experience = jd_data.get('experience', [])
+
+    jd_edu_text = ' '.join([edu.get('text', '') for edu in jd_education]).lower()
+    jd_exp_text = ' '.join([exp.get('text', '') for exp in jd_experience])
+    years_match = YEARS_PATTERN.search(jd_exp_text)
+
+    return {
+        'skills': jd_data.get('skills', []),
+        'has_education': bool(jd_education),
+        'degrees': [keyword for keyword in DEGREE_KEYWORDS if keyword in jd_edu_text],
+        'has_experience': bool(jd_experience),
+        'required_years': int(years_match.group(1)) if years_match else None
+    }
+
+def resume_degrees(education):
+    """Which of ``DEGREE_KEYWORDS`` a resume's education section mentions"""
+    text = ' '.join([edu.get('text', '') for edu in education]).lower()
+    return [keyword in text for keyword in DEGREE_KEYWORDS]
+
+def skill_scores(columns, jd_keys):
+    """Fraction of the job's skills each resume has"""
+    if not jd_keys:
+        return np.zeros(columns['skills'].shape[0], dtype=np.float32)
+    return overlap_counts(columns['skills'], jd_keys) / len(jd_keys)
+
+def education_scores(columns, requirements):
+    """Vectorized ``ResumeRanker._match_education`` scores"""
+    n = columns['has_education'].shape[0]
+    if not requirements['has_education']:
+        return np.ones(n, dtype=np.float32)
+
+    degree_columns = [DEGREE_KEYWORDS.index(keyword) for keyword in requirements['degrees']]
+    matched = columns['degrees'][:, degree_columns].any(axis=1)
+    scores = np.where(matched, 1.0, 0.5)
+    return np.where(columns['has_education'], scores, 0.0).astype(np.float32)
+
+def experience_scores(columns, requirements):
+    """Vectorized ``ResumeRanker._match_experience`` scores"""
+    count = columns['experience']
+    if not requirements['has_experience']:
+        return np.ones(count.shape[0], dtype=np.float32)
+
+    required_years = requirements['required_years']
+    if required_years is None:
+        scores = np.full(count.shape[0], 0.7)
+    elif required_years <= 0:
+        scores = np.ones(count.shape[0])
+    else:
+        scores = np.minimum(count / required_years, 1.0)
+    return np.where(count > 0, scores, 0.0).astype(np.float32)
+
+def hybrid_scores(similarities, columns, requirements, jd_keys, weights):
+    """Weighted average of all scoring signals, one array operation per signal"""
+    total = weights['similarity'] * np.asarray(similarities, dtype=np.float32)
+    if weights['skills']:
+        total += weights['skills'] * skill_scores(columns, jd_keys)
+    if weights['education']:
+        total += weights['education'] * education_scores(columns, requirements)
+    if weights['experience']:
+        total += weights['experience'] * experience_scores(columns, requirements)
+    return (total / sum(weights.values())).astype(np.float32)
+
+class ResumeFeatureStore:
+    """Per-resume scoring features kept as NumPy columns for bulk scoring.
+
+    Holds each resume's skill keys, degree keywords and number of experience
+    entries. Like the vector index, it is updated by ``Resume.save()`` and
+    polls for resumes saved by other processes.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.RLock()
+        self.sync_interval = 30
+        self.sync_overlap = 120
+        self._last_check = 0.0
+        self._indexes_checked = False
+        self._synced_generation = None
+        self._reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.sync_interval = app.config.get("RESUME_INDEX_SYNC_INTERVAL", 30)
+        self.sync_overlap = app.config.get("RESUME_INDEX_SYNC_OVERLAP", 120)
+        app.extensions["resume_features"] = self
+
+    def _reset(self):
+        self._ids = []
+        self._positions = {}
+        self._skill_keys = []
+        self._degrees = []
+        self._has_education = []
+        self._experience = []
+        self._columns = None
+        self._skill_postings = None
+        self.last_sync = None
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._positions)
+
+    def rebuild(self, batch_size=1000):
+        from app.models.resume import Resume
+
+        self._check_indexes()
+        with self._lock:
+            self._reset()
+            for resume_id, parsed_data, updated_at in Resume.iter_scoring_data(batch_size=batch_size):
+                self._upsert(resume_id, parsed_data, updated_at)
+            self.loaded = True
+            self._last_check = time.monotonic()
+
+    def _check_indexes(self):
+        from app.models.resume import Resume
+
+        if not self._indexes_checked:
+            Resume.ensure_indexes()
+            self._indexes_checked = True
+
+    def refresh(self, force=False):
+        """Apply changes saved by other processes since the last sync"""
+        from app.models.resume import Resume
+
+        if not self.loaded:
+            self.rebuild()
+            return
+
+        now = time.monotonic()
+        if not force and now - self._last_check < self.sync_interval:
+            return
+        self._last_check = now
+
+        self._check_indexes()
+        with self._lock:
+            since = poll_since(self.last_sync, self.sync_overlap)
+            for resume_id, parsed_data, updated_at in Resume.iter_scoring_data(since=since):
+                self._upsert(resume_id, parsed_data, updated_at)
+
+    def sync(self, generation):
+        """Refresh right away if ``generation``, the resumes' write counter, moved since the last call"""
+        if generation != self._synced_generation:
+            self.refresh(force=True)
+            self._synced_generation = generation
+
+    def upsert(self, resume_id, parsed_data, updated_at=None):
+        if not self.loaded:
+            return
+        with self._lock:
+            self._upsert(resume_id, parsed_data, updated_at)
+
+    def _upsert(self, resume_id, parsed_data, updated_at):
+        self.last_sync = advance_sync(self.last_sync, updated_at)
+
+        education = parsed_data.get('education', [])
+        row = (
+            skill_keys(parsed_data),
+            resume_degrees(education),
+            bool(education),
+            len(parsed_data.get('experience', []))
+        )
+        position = self._positions.get(resume_id)
+        if position is None:
+            self._positions[resume_id] = len(self._skill_keys)
+            self._ids.append(resume_id)
+            self._skill_keys.append(row[0])
+            self._degrees.append(row[1])
+            self._has_education.append(row[2])
+            self._experience.append(row[3])
+        else:
+            self._skill_keys[position], self._degrees[position], \
+                self._has_education[position], self._experience[position] = row
+        self._columns = None
+        self._skill_postings = None
+
+    def _all_columns(self):
+        """Columns for every stored resume plus one trailing all-empty row"""
+        if self._columns is None:
+            empty_degrees = [False] * len(DEGREE_KEYWORDS)
+            self._columns = {
+                'skills': skill_matrix(self._skill_keys + [[]]),
+                'degrees': np.array(self._degrees + [empty_degrees], dtype=bool).reshape(-1, len(DEGREE_KEYWORDS)),
+                'has_education': np.array(self._has_education + [False], dtype=bool),
+                'experience': np.array(self._experience + [0], dtype=np.float32),
+            }
+        return self._columns
+
+    def columns(self, resume_ids):
+        """Feature columns aligned with the given resume IDs; unknown IDs get empty features"""
+        self.refresh()
+        with self._lock:
+            columns = self._all_columns()
+            missing = len(self._skill_keys)
+            rows = np.fromiter(
+                (self._positions.get(resume_id, missing) for resume_id in resume_ids),
+                dtype=np.int64, count=len(resume_ids)
+            )
+        return {name: column[rows] for name, column in columns.items()}
+
+    def skill_candidates(self, keys):
+        """``{resume_id: count}`` of resumes having any of the given skill keys"""
+        self.refresh()
+        with self._lock:
+            if self._skill_postings is None:
+                # Column-major skill matrix: each column lists the resumes with that skill
+                self._skill_postings = skill_matrix(self._skill_keys).tocsc()
+            postings = self._skill_postings
+            ids = self._ids
+        columns = [column for column in vocabulary.ids(keys, add=False) if column < postings.shape[1]]
+        if not columns:
+            return {}
+        rows = np.concatenate([
+            postings.indices[postings.indptr[column]:postings.indptr[column + 1]] for column in columns
+        ])
+        positions, counts = np.unique(rows, return_counts=True)
+        return {ids[position]: int(count) for position, count in zip(positions.tolist(), counts.tolist())}
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+from spacy.matcher import PhraseMatcher
+
+DEFAULT_DICTIONARY = Path(__file__).parent / "data" / "skills.json"
+
+# Phrases that introduce a free-text list of skills, compiled into one
+# alternation so the text is scanned once. The lookahead keeps matches
+# zero-width, which lets every phrase be found even when it sits inside
+# the skill list captured for an earlier phrase.
+SKILL_PHRASES = [
+    "experience with", "familiar with", "knowledge of", "skilled in",
+    "proficient in", "expertise in", "competent in", "trained in"
+]
+SKILL_PHRASE_RE = re.compile(
+    r"(?=(" + "|".join(re.escape(phrase) for phrase in SKILL_PHRASES) + r")\s([\w\s,]+))",
+    re.IGNORECASE
+)
+SKILL_SPLIT_RE = re.compile(r",|\sand\s")
+
+def load_dictionary(path=DEFAULT_DICTIONARY):
+    """Load a skills dictionary mapping canonical names to lists of synonyms"""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def dictionary_path(path=None):
+    return Path(path or os.environ.get("SKILLS_DICTIONARY") or DEFAULT_DICTIONARY)
+
+_dictionary_hashes = {}
+
+def dictionary_version(path=None):
+    """Short hash of the dictionary's contents, re-read only when the file changes"""
+    path = dictionary_path(path)
+    stamp = path.stat().st_mtime_ns
+    cached = _dictionary_hashes.get(path)
+    if cached is None or cached[0] != stamp:
+        cached = _dictionary_hashes[path] = (stamp, hashlib.sha1(path.read_bytes()).hexdigest()[:12])
+    return cached[1]
+
+def find_phrase_skills(text):
+    """Skills listed after phrases such as 'proficient in'"""
+    skills = set()
+    # A phrase only matches again after the end of its previous match
+    consumed = {}
+    for match in SKILL_PHRASE_RE.finditer(text):
+        phrase = match.group(1).lower()
+        if match.start() < consumed.get(phrase, 0):
+            continue
+        consumed[phrase] = match.end(2)
+        
+        # Split by commas and 'and'
+        for skill in SKILL_SPLIT_RE.split(match.group(2).strip()):
+            if skill.strip():
+                skills.add(skill.strip())
+    return skills
+
+class SkillMatcher:
+    """Finds known skills and their synonyms in one pass over a doc.
+
+    Every canonical skill name and synonym is compiled once into a spaCy
+    PhraseMatcher on lowercase token text, so matching cost does not grow
+    with the size of the taxonomy.
+    """
+    
+    def __init__(self, nlp, dictionary):
+        self.matcher = PhraseMatcher(nlp.vocab, attr="LOWER")
+        self._canonical = {}
+        for canonical, synonyms in dictionary.items():
+            terms = [canonical] + list(synonyms)
+            match_id = nlp.vocab.strings.add(canonical)
+            self._canonical[match_id] = canonical
+            self.matcher.add(canonical, [nlp.make_doc(term) for term in terms])
+    
+    def __len__(self):
+        return len(self._canonical)
+    
+    def find(self, doc):
+        """Canonical names of all dictionary skills mentioned in a doc"""
+        return {self._canonical[match_id] for match_id, _, _ in self.matcher(doc)}
+
+# One matcher per pipeline, since patterns are tied to a pipeline's vocab
+_matchers = {}
+_matcher_path = None
+_matcher_lock = threading.Lock()
+
+def get_skill_matcher(nlp, path=None):
+    """Shared matcher of a pipeline for the configured dictionary, compiled on first use"""
+    global _matcher_path
+    path = dictionary_path(path)
+    with _matcher_lock:
+        if _matcher_path != path:
+            _matchers.clear()
+            _matcher_path = path
+        matcher = _matchers.get(nlp)
+        if matcher is None:
+            matcher = _matchers[nlp] = SkillMatcher(nlp, load_dictionary(path))
+    return matcher
+
+# Normalized skill keys: lowercase, single-spaced, synonyms mapped to their
+# canonical name and interned. They are stored as ``parsed_data.skill_keys``
+# when a document is parsed, so matching is a set lookup.
+
+_synonyms = None
+_synonyms_path = None
+_synonyms_lock = threading.Lock()
+
+def _clean(skill):
+    return " ".join(skill.lower().split())
+
+def get_synonym_table(path=None):
+    """Map of every lowercased skill name and synonym to its canonical key"""
+    global _synonyms, _synonyms_path
+    path = dictionary_path(path)
+    with _synonyms_lock:
+        if _synonyms is None or _synonyms_path != path:
+            table = {}
+            for canonical, synonyms in load_dictionary(path).items():
+                key = sys.intern(_clean(canonical))
+                for term in [canonical] + list(synonyms):
+                    table[_clean(term)] = key
+            _synonyms = table
+            _synonyms_path = path
+    return _synonyms
+
+def normalize_skill(skill, table=None):
+    """Normalized key of a single skill"""
+    table = get_synonym_table() if table is None else table
+    key = _clean(skill)
+    return table.get(key) or sys.intern(key)
+
+def normalize_skills(skills):
+    """Sorted, de-duplicated normalized keys of a list of skills"""
+    table = get_synonym_table()
+    return sorted({normalize_skill(skill, table) for skill in skills if skill.strip()})
+
+def skill_keys(parsed_data):
+    """Stored skill keys of a parsed document, derived on the fly for older documents"""
+    keys = parsed_data.get('skill_keys')
+    if keys is None:
+        keys = normalize_skills(parsed_data.get('skills', []))
+    return keys
+
+def unique_skills(skills):
+    """``(display name, key)`` pairs, keeping the first spelling of each key"""
+    table = get_synonym_table()
+    seen = set()
+    pairs = []
+    for skill in skills:
+        key = normalize_skill(skill, table)
+        if key not in seen and skill.strip():
+            seen.add(key)
+            pairs.append((skill, key))
+    return pairs
+
+def match_skills(jd_skills, resume_keys):
+    """Split the job's skills into those the resume has and those it lacks"""
+    resume_keys = resume_keys if isinstance(resume_keys, (set, frozenset)) else set(resume_keys)
+    matching_skills = []
+    missing_skills = []
+    for skill, key in unique_skills(jd_skills):
+        if key in resume_keys:
+            matching_skills.append(skill)
+        else:
+            missing_skills.append(skill)
+    return matching_skills, missing_skills
+
+class SkillVocabulary:
+    """Process-wide numbering of skill keys, the columns of skill matrices"""
+    
+    def __init__(self):
+        self._ids = {}
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self._ids)
+    
+    def ids(self, keys, add=True):
+        """Column numbers of the given keys; unknown keys are added or skipped"""
+        columns = []
+        for key in keys:
+            column = self._ids.get(key)
+            if column is None and add:
+                with self._lock:
+                    column = self._ids.setdefault(key, len(self._ids))
+            if column is not None:
+                columns.append(column)
+        return columns
+
+vocabulary = SkillVocabulary()
+
+def skill_matrix(key_lists):
+    """Binary CSR matrix with one row per document and one column per known skill"""
+    indptr = [0]
+    indices = []
+    for keys in key_lists:
+        indices.extend(vocabulary.ids(keys))
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.float32)
+    return sparse.csr_matrix(
+        (data, np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+        shape=(len(indptr) - 1, len(vocabulary))
+    )
+
+def overlap_counts(matrix, keys):
+    """How many of the given skill keys each row of a skill matrix contains"""
+    indicator = np.zeros(matrix.shape[1], dtype=np.float32)
+    columns = [column for column in vocabulary.ids(keys, add=False) if column < matrix.shape[1]]
+    indicator[columns] = 1.0
+    return np.asarray(matrix.dot(indicator), dtype=np.float32).ravel()
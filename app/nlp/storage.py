@@ -0,0 +1,92 @@
+import datetime
+import struct
+
+import numpy as np
+from bson.binary import Binary
+from flask import current_app
+
+# Storage formats for document vectors in MongoDB
+#   list   - plain BSON array of doubles (the original format)
+#   dense  - Binary holding every component as float32
+#   sparse - Binary holding the non-zero components as uint32 index + float32 value
+VECTOR_FORMATS = ("list", "dense", "sparse")
+
+def stored_datetime(value=None):
+    """``value`` (default: now) truncated to the millisecond precision MongoDB keeps"""
+    value = value or datetime.datetime.now()
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+# Model tag assumed for vectors stored before vectors were tagged
+LEGACY_VECTOR_MODEL = "tfidf:legacy"
+
+# User-defined BSON binary subtype used for encoded vectors
+VECTOR_SUBTYPE = 0x80
+
+_HEADER = struct.Struct("<cI")  # format code, dimension
+_DENSE = b"d"
+_SPARSE = b"s"
+
+def configured_format():
+    """Storage format new vectors are written in"""
+    return current_app.config.get("VECTOR_STORAGE_FORMAT", "sparse")
+
+def encode_vector(vector, fmt=None):
+    """Encode a vector for storage in the requested (or configured) format"""
+    if fmt is None:
+        fmt = configured_format()
+    if vector is None:
+        return None
+    if fmt not in VECTOR_FORMATS:
+        raise ValueError(f"Unknown vector storage format: {fmt}")
+
+    array = np.asarray(vector, dtype=np.float32).ravel()
+    if fmt == "list":
+        return array.tolist()
+
+    if fmt == "dense":
+        payload = _HEADER.pack(_DENSE, array.shape[0]) + array.astype("<f4").tobytes()
+    else:
+        indices = np.flatnonzero(array).astype("<u4")
+        values = array[indices].astype("<f4")
+        payload = _HEADER.pack(_SPARSE, array.shape[0]) + indices.tobytes() + values.tobytes()
+    return Binary(payload, VECTOR_SUBTYPE)
+
+def decode_vector(value):
+    """Decode a stored vector into a dense float32 array.
+
+    Accepts every format in ``VECTOR_FORMATS`` so documents written before
+    the binary encodings existed keep working.
+    """
+    if value is None:
+        return None
+    if isinstance(value, np.ndarray):
+        return value.astype(np.float32, copy=False)
+    if not isinstance(value, (bytes, bytearray)):
+        return np.asarray(value, dtype=np.float32)
+
+    data = memoryview(value)
+    code, dimension = _HEADER.unpack_from(data)
+    body = data[_HEADER.size:]
+    if code == _DENSE:
+        return np.frombuffer(body, dtype="<f4", count=dimension).astype(np.float32)
+    if code == _SPARSE:
+        nnz = len(body) // 8
+        indices = np.frombuffer(body, dtype="<u4", count=nnz)
+        values = np.frombuffer(body, dtype="<f4", count=nnz, offset=4 * nnz)
+        vector = np.zeros(dimension, dtype=np.float32)
+        vector[indices] = values
+        return vector
+    raise ValueError(f"Unknown vector encoding: {code!r}")
+
+def vector_format(value):
+    """Name of the storage format a stored vector is in"""
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray)):
+        code = bytes(value[:1])
+        return {_DENSE: "dense", _SPARSE: "sparse"}.get(code)
+    return "list"
+
+def has_vector(vector):
+    """Whether a decoded vector is present and non-empty"""
+    return vector is not None and len(vector) > 0
@@ -1,36 +1,108 @@
+from flask import current_app, has_app_context
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
-import spacy
-import pickle
+from app.nlp.storage import has_vector
+from app.nlp.skills import match_skills, normalize_skills
+from app.nlp.registry import get_model
+import datetime
 import os
+import pickle
+import threading
 from pathlib import Path
 
-# Load spaCy model for BERT-like embeddings
-try:
-    nlp = spacy.load("en_core_web_md")
-except:
-    # If model not found, download it
-    os.system("python -m spacy download en_core_web_md")
-    nlp = spacy.load("en_core_web_md")
+# spaCy model for BERT-like embeddings, only loaded by the "spacy" method
+SPACY_VECTOR_MODEL = "en_core_web_md"
+
+# Versioned TF-IDF artifacts live in models/tfidf/<version>.pkl and the
+# CURRENT file names the active one. The single pickle used before models
+# were versioned is still loaded as version "legacy".
+MODELS_DIR = Path(__file__).parent / "models"
+TFIDF_DIR = MODELS_DIR / "tfidf"
+TFIDF_CURRENT_FILE = TFIDF_DIR / "CURRENT"
+LEGACY_TFIDF_PATH = MODELS_DIR / "tfidf_vectorizer.pkl"
+LEGACY_VERSION = "legacy"
+
+def new_tfidf_model(max_features=5000):
+    """Unfitted TF-IDF model with the project's settings"""
+    return TfidfVectorizer(
+        max_features=max_features,
+        stop_words='english',
+        ngram_range=(1, 2)
+    )
+
+def current_tfidf_version():
+    """Version of the active TF-IDF artifact, or None if there is none"""
+    if TFIDF_CURRENT_FILE.exists():
+        return TFIDF_CURRENT_FILE.read_text().strip()
+    if LEGACY_TFIDF_PATH.exists():
+        return LEGACY_VERSION
+    return None
+
+def tfidf_path(version):
+    if version == LEGACY_VERSION:
+        return LEGACY_TFIDF_PATH
+    return TFIDF_DIR / f"{version}.pkl"
+
+def load_tfidf_model(version):
+    with open(tfidf_path(version), 'rb') as f:
+        return pickle.load(f)
+
+def save_tfidf_model(model, version=None, activate=True):
+    """Write a fitted model as a new versioned artifact and optionally activate it"""
+    version = version or datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    TFIDF_DIR.mkdir(parents=True, exist_ok=True)
+    
+    path = tfidf_path(version)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(model, f)
+    os.replace(tmp_path, path)
+    
+    if activate:
+        tmp_current = TFIDF_CURRENT_FILE.with_suffix(".tmp")
+        tmp_current.write_text(version)
+        os.replace(tmp_current, TFIDF_CURRENT_FILE)
+    return version
+
+def _current_stamp():
+    """Modification time of the CURRENT pointer, used to notice new versions cheaply"""
+    try:
+        return TFIDF_CURRENT_FILE.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
 
 class ResumeVectorizer:
     def __init__(self, method="tfidf"):
         self.method = method
-        self.model_path = Path("app/nlp/models")
-        self.model_path.mkdir(exist_ok=True)
-        
-        if method == "tfidf":
-            self.tfidf_path = self.model_path / "tfidf_vectorizer.pkl"
-            if self.tfidf_path.exists():
-                with open(self.tfidf_path, 'rb') as f:
-                    self.vectorizer = pickle.load(f)
-            else:
-                self.vectorizer = TfidfVectorizer(
-                    max_features=5000,
-                    stop_words='english',
-                    ngram_range=(1, 2)
-                )
+        self.tfidf_version = None
+        self.load_count = 0
+        self._model = None
+        self._stamp = None
+        self._lock = threading.RLock()
+    
+    @property
+    def vectorizer(self):
+        """The TF-IDF model, loaded on first use and reloaded when a new version is activated"""
+        stamp = _current_stamp()
+        if self._model is None or stamp != self._stamp:
+            with self._lock:
+                if self._model is None or stamp != self._stamp:
+                    version = current_tfidf_version()
+                    if self._model is None or version != self.tfidf_version:
+                        self._model = load_tfidf_model(version) if version else new_tfidf_model()
+                        self.tfidf_version = version
+                        self.load_count += 1
+                    self._stamp = stamp
+        return self._model
+    
+    @property
+    def model_version(self):
+        """Tag stored next to every vector so mixed-model comparisons can be detected"""
+        if self.method == "tfidf":
+            self.vectorizer  # make sure the active version is loaded
+            return f"tfidf:{self.tfidf_version}"
+        return f"spacy:{SPACY_VECTOR_MODEL}"
     
     def _preprocess_text(self, text):
         """Preprocess text for vectorization"""
@@ -40,9 +112,8 @@ class ResumeVectorizer:
         text = ' '.join(text.split())
         return text
     
-    def vectorize_resume(self, resume_data):
-        """Vectorize resume data"""
-        # Combine all relevant text fields
+    def document_text(self, resume_data):
+        """Combine all relevant text fields into one preprocessed string"""
         text_fields = [
             resume_data.get('full_text', ''),
             ' '.join(resume_data.get('skills', [])),
@@ -51,26 +122,56 @@ class ResumeVectorizer:
         ]
         
         text = ' '.join(text_fields)
-        text = self._preprocess_text(text)
+        return self._preprocess_text(text)
+    
+    def _tfidf_snapshot(self, texts):
+        """The active TF-IDF model and its version tag, taken together under the lock.
+        
+        The model hot-reloads when a new version is activated, so reading the
+        model and its version separately could tag a vector with the wrong one.
+        """
+        with self._lock:
+            model = self.vectorizer
+            # Without any fitted model, bootstrap one from the first document
+            # so the app stays usable; 'flask fit-vectorizer' replaces it with
+            # a model fitted on the whole corpus
+            if not hasattr(model, 'vocabulary_'):
+                model.fit(texts[:1])
+                self.tfidf_version = save_tfidf_model(
+                    model,
+                    "bootstrap-" + datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+                )
+            return model, f"tfidf:{self.tfidf_version}"
+    
+    def vectorize_many(self, resume_data_list):
+        """Vectorize a batch of documents together, returning ``(vectors, model_version)``"""
+        texts = [self.document_text(resume_data) for resume_data in resume_data_list]
         
         if self.method == "tfidf":
-            # If the vectorizer is not fitted yet, fit it
-            if not hasattr(self.vectorizer, 'vocabulary_'):
-                self.vectorizer.fit([text])
-                with open(self.tfidf_path, 'wb') as f:
-                    pickle.dump(self.vectorizer, f)
-            
-            # Transform the text to a vector
-            vector = self.vectorizer.transform([text]).toarray()[0]
-            return vector.tolist()  # Convert to list for MongoDB storage
+            model, model_version = self._tfidf_snapshot(texts)
+            matrix = model.transform(texts).astype(np.float32)
+            return [matrix[i].toarray()[0] for i in range(matrix.shape[0])], model_version
         
         elif self.method == "spacy":
             # Use spaCy's word vectors
-            doc = nlp(text)
-            if doc.vector.any():  # Check if vector is not all zeros
-                return doc.vector.tolist()
-            else:
-                return [0.0] * 300  # Default vector size for spaCy
+            vectors = [
+                doc.vector.astype(np.float32) if doc.vector.any() else np.zeros(300, dtype=np.float32)  # Default vector size for spaCy
+                for doc in get_model(SPACY_VECTOR_MODEL).pipe(texts)
+            ]
+            return vectors, self.model_version
+    
+    def vectorize(self, resume_data):
+        """Vectorize one document, returning ``(vector, model_version)`` of the model used"""
+        vectors, model_version = self.vectorize_many([resume_data])
+        return vectors[0], model_version
+    
+    def vectorize_resume(self, resume_data):
+        """Vectorize resume data"""
+        return self.vectorize(resume_data)[0]
+    
+    def vectorize_resumes(self, resume_data_list):
+        """Vectorize a batch of resumes, transforming them together"""
+        return self.vectorize_many(resume_data_list)[0]
     
     def vectorize_job_description(self, jd_data):
         """Vectorize job description data"""
@@ -79,7 +180,7 @@ class ResumeVectorizer:
     
     def compute_similarity(self, resume_vector, jd_vector):
         """Compute cosine similarity between resume and job description vectors"""
-        if not resume_vector or not jd_vector:
+        if not has_vector(resume_vector) or not has_vector(jd_vector):
             return 0.0
         
         # Convert to numpy arrays
@@ -92,16 +193,30 @@ class ResumeVectorizer:
     
     def get_matching_skills(self, resume_skills, jd_skills):
         """Get matching and missing skills"""
-        resume_skills_lower = [skill.lower() for skill in resume_skills]
-        jd_skills_lower = [skill.lower() for skill in jd_skills]
-        
-        matching_skills = []
-        missing_skills = []
-        
-        for skill in jd_skills:
-            if skill.lower() in resume_skills_lower:
-                matching_skills.append(skill)
-            else:
-                missing_skills.append(skill)
-        
-        return matching_skills, missing_skills
+        # Compared by normalized key, so synonyms and case variants match
+        return match_skills(jd_skills, normalize_skills(resume_skills))
+
+
+# One shared vectorizer per method for the whole process
+_instances = {}
+_instances_lock = threading.Lock()
+
+def get_vectorizer(method=None):
+    """Process-wide shared vectorizer; its model is loaded lazily on first use.
+    
+    Without a ``method`` the app's ``VECTORIZER_METHOD`` is used.
+    """
+    if method is None:
+        method = current_app.config.get("VECTORIZER_METHOD", "tfidf") if has_app_context() else "tfidf"
+    vectorizer = _instances.get(method)
+    if vectorizer is None:
+        with _instances_lock:
+            vectorizer = _instances.setdefault(method, ResumeVectorizer(method=method))
+    return vectorizer
+
+def vectorizer_stats():
+    """How often each shared vectorizer has (re)loaded its model"""
+    return {
+        method: {'model_version': vectorizer.tfidf_version, 'load_count': vectorizer.load_count}
+        for method, vectorizer in _instances.items()
+    }
@@ -1,10 +1,11 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 import os
 from app.models.resume import Resume
-from app.nlp.parser import parse_resume
-from app.nlp.vectorizer import ResumeVectorizer
+from app.nlp.ranker import ResumeRanker
+from app import parse_queue
+from app.files import save_content_addressed
 from app.forms.resume_form import ResumeUploadForm
 
 applicant = Blueprint('applicant', __name__)
@@ -19,9 +20,14 @@ def dashboard():
     # Get the applicant's resume
     resume = None
     if current_user.resume_id:
-        resume = Resume.get_by_id(current_user.resume_id)
+        resume = Resume.get_by_id(current_user.resume_id, Resume.SUMMARY_PROJECTION)
     
-    return render_template('applicant/dashboard.html', title='Applicant Dashboard', resume=resume)
+    # Open positions that fit the resume best
+    matching_jobs = []
+    if resume and resume.status == 'ready':
+        matching_jobs = ResumeRanker().rank_jobs_for_resume(resume.id, top_k=current_app.config['MATCHING_JOBS_LIMIT'])
+    
+    return render_template('applicant/dashboard.html', title='Applicant Dashboard', resume=resume, matching_jobs=matching_jobs)
 
 @applicant.route('/applicant/upload-resume', methods=['GET', 'POST'])
 @login_required
@@ -33,37 +39,49 @@ def upload_resume():
     form = ResumeUploadForm()
     
     if form.validate_on_submit():
-        # Save the uploaded file
+        # Save the uploaded file under the hash of its content
         resume_file = form.resume.data
         filename = secure_filename(resume_file.filename)
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-        resume_file.save(file_path)
+        content_hash, file_path = save_content_addressed(
+            resume_file.stream, current_app.config['UPLOAD_FOLDER'], os.path.splitext(filename)[1]
+        )
         
-        try:
-            # Parse the resume
-            parsed_data = parse_resume(file_path)
-            
-            # Create or update resume
-            resume = Resume.get_by_user_id(current_user.id) or Resume()
-            resume.user_id = current_user.id
-            resume.filename = filename
-            resume.parsed_data = parsed_data
-            
-            # Vectorize the resume
-            vectorizer = ResumeVectorizer()
-            resume.vector = vectorizer.vectorize_resume(parsed_data)
-            
-            # Save to database
-            resume.save()
-            
-            flash('Resume uploaded and parsed successfully!', 'success')
+        resume = Resume.get_by_user_id(current_user.id, {'vector': 0, 'parsed_data': 0}) or Resume()
+        if resume.id and resume.content_hash == content_hash and resume.status == 'ready':
+            flash('This resume is identical to the one we already analyzed.', 'info')
             return redirect(url_for('applicant.dashboard'))
-            
-        except Exception as e:
-            flash(f'Error processing resume: {str(e)}', 'danger')
+        
+        # Record the upload and hand parsing off to the background queue
+        resume.user_id = current_user.id
+        resume.filename = filename
+        resume.content_hash = content_hash
+        resume.status = 'processing'
+        resume.error = None
+        resume.save()
+        
+        parse_queue.submit(current_app._get_current_object(), resume.id, file_path, content_hash)
+        
+        flash('Resume uploaded! We are analyzing it now.', 'success')
+        return redirect(url_for('applicant.dashboard'))
     
     return render_template('applicant/upload_resume.html', title='Upload Resume', form=form)
 
+@applicant.route('/applicant/resume-status')
+@login_required
+def resume_status():
+    if current_user.role != 'applicant':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    resume = Resume.get_by_user_id(current_user.id, {'vector': 0, 'parsed_data': 0})
+    if not resume:
+        return jsonify({'status': None})
+    
+    # A parse job lost to a restart is requeued, or failed if its file is gone
+    if resume.status == 'processing':
+        parse_queue.recover(current_app._get_current_object(), resume)
+    
+    return jsonify({'status': resume.status, 'error': resume.error})
+
 @applicant.route('/applicant/view-resume')
 @login_required
 def view_resume():
@@ -74,7 +92,7 @@ def view_resume():
     # Get the applicant's resume
     resume = None
     if current_user.resume_id:
-        resume = Resume.get_by_id(current_user.resume_id)
+        resume = Resume.get_by_id(current_user.resume_id, Resume.SUMMARY_PROJECTION)
     
     if not resume:
         flash('No resume found. Please upload your resume.', 'info')
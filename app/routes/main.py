@@ -1,5 +1,8 @@
-from flask import Blueprint, render_template, redirect, url_for
-from flask_login import current_user
+from flask import Blueprint, render_template, redirect, url_for, jsonify
+from flask_login import current_user, login_required
+from app import parse_queue, ranking_cache
+from app.nlp.retrieval import recall_audit
+from app.nlp.vectorizer import vectorizer_stats
 
 main = Blueprint('main  render_template, redirect, url_for', __name__)
 from flask_login import current_user
@@ -19,3 +22,16 @@ def index():
 @main.route('/about')
 def about():
     return render_template('main/about.html', title='About SmartHire')
+
+@main.route('/metrics')
+@login_required
+def metrics():
+    if current_user.role != 'recruiter':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify({
+        'vectorizers': vectorizer_stats(),
+        'ranking_cache': ranking_cache.stats(),
+        'shortlist_recall': recall_audit.stats(),
+        'parse_queue': parse_queue.stats()
+    })
\ No newline at end of file
@@ -1,10 +1,13 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify, abort, Response, stream_with_context
 from flask_login import login_required, current_user
+import base64
+import json
 from app.models.job_description import JobDescription
 from app.models.resume import Resume
 from app.nlp.parser import parse_job_description
-from app.nlp.vectorizer import ResumeVectorizer
+from app.nlp.vectorizer import get_vectorizer
 from app.nlp.ranker import ResumeRanker
+from app.nlp.scoring import SCORING_FEATURES
 from app.forms.job_description_form import JobDescriptionForm
 
 recruiter = Blueprint('recruiter', __name__)
@@ -17,7 +20,7 @@ def dashboard():
         return redirect(url_for('main.index'))
     
     # Get all job descriptions for this recruiter
-    job_descriptions = JobDescription.get_by_recruiter_id(current_user.id)
+    job_descriptions = JobDescription.get_by_recruiter_id(current_user.id, JobDescription.SUMMARY_PROJECTION)
     
     return render_template('recruiter/dashboard.html', title='Recruiter Dashboard', job_descriptions=job_descriptions)
 
@@ -32,7 +35,7 @@ def add_job_description():
     
     if form.validate_on_submit():
         # Parse the job description
-        parsed_data = parse_job_description(form.description.data)
+        parsed_data = parse_job_description(form.description.data, fast=current_app.config['PARSER_FAST_MODE'])
         
         # Create job description
         jd = JobDescription()
@@ -42,9 +45,16 @@ def add_job_description():
         jd.description = form.description.data
         jd.parsed_data = parsed_data
         
+        # Per-job ranking weights, only for the fields the recruiter filled in
+        weights = {
+            name: getattr(form, f'{name}_weight').data for name in SCORING_FEATURES
+            if getattr(form, f'{name}_weight').data is not None
+        }
+        jd.scoring_weights = weights or None
+        
         # Vectorize the job description
-        vectorizer = ResumeVectorizer()
-        jd.vector = vectorizer.vectorize_job_description(parsed_data)
+        vectorizer = get_vectorizer()
+        jd.vector, jd.vector_model = vectorizer.vectorize(parsed_data)
         
         # Save to database
         jd.save()
@@ -62,7 +72,7 @@ def view_job_description(jd_id):
         return redirect(url_for('main.index'))
     
     # Get the job description
-    jd = JobDescription.get_by_id(jd_id)
+    jd = JobDescription.get_by_id(jd_id, {'vector': 0})
     
     if not jd or jd.recruiter_id != current_user.id:
         flash('Job description not found.', 'danger')
@@ -70,6 +80,33 @@ def view_job_description(jd_id):
     
     return render_template('recruiter/view_job_description.html', title='View Job Description', jd=jd)
 
+def _encode_cursor(offset):
+    return base64.urlsafe_b64encode(json.dumps({'offset': offset}).encode()).decode()
+
+def _decode_cursor(cursor):
+    try:
+        return max(int(json.loads(base64.urlsafe_b64decode(cursor.encode()))['offset']), 0)
+    except (ValueError, KeyError, TypeError):
+        return None
+
+def _ranking_args(default_limit=25, max_limit=100):
+    """Read limit, offset/cursor and min_score from the query string"""
+    limit = min(max(request.args.get('limit', default_limit, type=int), 1), max_limit)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    if request.args.get('cursor'):
+        offset = _decode_cursor(request.args['cursor'])
+        if offset is None:
+            abort(400, description='Invalid cursor')
+    min_score = request.args.get('min_score', type=float)
+    return limit, offset, min_score
+
+def _get_own_job_description(jd_id, projection=None):
+    """The job description if it exists and belongs to the current recruiter"""
+    jd = JobDescription.get_by_id(jd_id, projection)
+    if not jd or jd.recruiter_id != current_user.id:
+        return None
+    return jd
+
 @recruiter.route('/recruiter/rank-resumes/<jd_id>')
 @login_required
 def rank_resumes(jd_id):
@@ -78,17 +115,81 @@ def rank_resumes(jd_id):
         return redirect(url_for('main.index'))
     
     # Get the job description
-    jd = JobDescription.get_by_id(jd_id)
+    jd = _get_own_job_description(jd_id, JobDescription.DETAIL_PROJECTION)
     
-    if not jd or jd.recruiter_id != current_user.id:
+    if not jd:
+        flash('Job description not found.', 'danger')
+        return redirect(url_for('recruiter.dashboard'))
+    
+    # Rank resumes, one page at a time
+    limit, offset, min_score = _ranking_args()
+    ranker = ResumeRanker()
+    page = ranker.rank_resumes_page(jd_id, limit=limit, offset=offset, min_score=min_score)
+    
+    return render_template('recruiter/ranked_resumes.html', title='Ranked Resumes', jd=jd,
+                           ranked_resumes=page['results'], page=page, min_score=min_score)
+
+@recruiter.route('/api/recruiter/jobs/<jd_id>/ranked-resumes')
+@login_required
+def ranked_resumes_api(jd_id):
+    if current_user.role != 'recruiter':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    if not _get_own_job_description(jd_id, {'recruiter_id': 1}):
+        return jsonify({'error': 'Job description not found'}), 404
+    
+    limit, offset, min_score = _ranking_args()
+    ranker = ResumeRanker()
+    page = ranker.rank_resumes_page(jd_id, limit=limit, offset=offset, min_score=min_score)
+    
+    if page['next_offset'] is not None:
+        page['next_cursor'] = _encode_cursor(page['next_offset'])
+    else:
+        page['next_cursor'] = None
+    return jsonify(page)
+
+@recruiter.route('/api/recruiter/jobs/<jd_id>/ranked-resumes.ndjson')
+@login_required
+def export_ranked_resumes(jd_id):
+    if current_user.role != 'recruiter':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    if not _get_own_job_description(jd_id, {'recruiter_id': 1}):
+        return jsonify({'error': 'Job description not found'}), 404
+    
+    min_score = request.args.get('min_score', type=float)
+    ranker = ResumeRanker()
+    
+    def generate():
+        for rank, entry in enumerate(ranker.iter_ranked_resumes(jd_id, min_score=min_score), start=1):
+            entry['rank'] = rank
+            yield json.dumps(entry) + '\n'
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename=ranked-resumes-{jd_id}.ndjson'}
+    )
+
+@recruiter.route('/recruiter/candidate-insights/<jd_id>')
+@login_required
+def candidate_insights(jd_id):
+    if current_user.role != 'recruiter':
+        flash('Access denied. You are not a recruiter.', 'danger')
+        return redirect(url_for('main.index'))
+    
+    jd = _get_own_job_description(jd_id, JobDescription.SUMMARY_PROJECTION)
+    
+    if not jd:
         flash('Job description not found.', 'danger')
         return redirect(url_for('recruiter.dashboard'))
     
-    # Rank resumes
+    # Insights for the whole top of the ranking, computed in one batch
+    top_k = min(max(request.args.get('top_k', 50, type=int), 1), 200)
     ranker = ResumeRanker()
-    ranked_resumes = ranker.rank_resumes_for_job(jd_id)
+    insights = ranker.get_top_candidate_insights(jd_id, top_k=top_k)
     
-    return render_template('recruiter/ranked_resumes.html', title='Ranked Resumes', jd=jd, ranked_resumes=ranked_resumes)
+    return render_template('recruiter/candidate_insights.html', title='Candidate Insights', jd=jd, insights=insights, top_k=top_k)
 
 @recruiter.route('/recruiter/resume-insights/<jd_id>/<resume_id>')
 @login_required
@@ -98,14 +199,14 @@ def resume_insights(jd_id, resume_id):
         return redirect(url_for('main.index'))
     
     # Get the job description
-    jd = JobDescription.get_by_id(jd_id)
+    jd = JobDescription.get_by_id(jd_id, JobDescription.DETAIL_PROJECTION)
     
     if not jd or jd.recruiter_id != current_user.id:
         flash('Job description not found.', 'danger')
         return redirect(url_for('recruiter.dashboard'))
     
     # Get the resume
-    resume = Resume.get_by_id(resume_id)
+    resume = Resume.get_by_id(resume_id, Resume.SUMMARY_PROJECTION)
     
     if not resume:
         flash('Resume not found.', 'danger')
@@ -17,4 +17,22 @@ document.addEventListener("DOMContentLoaded", () => {
       bsAlert.close()
     })
   }, 5000)
+
+  // Poll background processing status and reload once it finishes
+  var statusElement = document.querySelector("[data-status-url]")
+  if (statusElement) {
+    var pollStatus = () => {
+      fetch(statusElement.dataset.statusUrl, { credentials: "same-origin" })
+        .then((response) => response.json())
+        .then((data) => {
+          if (data.status === "processing") {
+            setTimeout(pollStatus, 2000)
+          } else {
+            window.location.reload()
+          }
+        })
+        .catch(() => setTimeout(pollStatus, 5000))
+    }
+    setTimeout(pollStatus, 2000)
+  }
 })
@@ -0,0 +1,414 @@
+import datetime
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+class ParseError(Exception):
+    """A document that could not be parsed inside the isolated parser pool"""
+
+# Parser children run single-threaded BLAS/OpenMP: the pool already parses
+# in parallel, and every extra thread reserves stack and buffer address
+# space that counts against the memory limit
+PARSER_CHILD_ENV = {'OPENBLAS_NUM_THREADS': '1', 'OMP_NUM_THREADS': '1', 'MKL_NUM_THREADS': '1'}
+
+_spawn_lock = threading.Lock()
+
+@contextmanager
+def _child_environment(overrides):
+    """Temporarily add unset variables to os.environ, which spawned children inherit"""
+    with _spawn_lock:
+        added = {name: value for name, value in overrides.items() if name not in os.environ}
+        os.environ.update(added)
+        try:
+            yield
+        finally:
+            for name in added:
+                os.environ.pop(name, None)
+
+def _parser_worker(conn, cpu_limit, memory_limit_mb, fast=False):
+    """Parser process loop: parse one document per request until told to stop"""
+    # Ignore Ctrl+C in the children; the web process shuts them down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    
+    # Import NumPy/spaCy and load the model before limiting the address
+    # space, so the limit bounds parsing rather than library start-up
+    from app.nlp.parser import get_fast_nlp, get_nlp, parse_resume
+    if fast:
+        get_fast_nlp()
+    else:
+        get_nlp()
+    
+    if resource is not None and memory_limit_mb:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        
+        file_path, fast = request
+        if resource is not None and cpu_limit:
+            # RLIMIT_CPU counts the whole process, so move the soft limit
+            # along with the CPU time already spent on earlier documents
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            soft = int(usage.ru_utime + usage.ru_stime) + 1 + cpu_limit
+            _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+            if hard != resource.RLIM_INFINITY:
+                soft = min(soft, hard)
+            resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+        
+        try:
+            conn.send(('ok', parse_resume(file_path, fast=fast)))
+        except MemoryError:
+            conn.send(('error', f"Resume exceeded the {memory_limit_mb} MB parser memory limit"))
+        except Exception as e:
+            conn.send(('error', str(e) or e.__class__.__name__))
+
+class _ParserProcess:
+    """One parser child process and the pipe used to talk to it"""
+    
+    def __init__(self, context, cpu_limit, memory_limit_mb, fast=False):
+        self.cpu_limit = cpu_limit
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_parser_worker, args=(child_conn, cpu_limit, memory_limit_mb, fast),
+            name="resume-parser", daemon=True
+        )
+        # Set before the child starts: it imports NumPy while unpickling its target
+        with _child_environment(PARSER_CHILD_ENV):
+            self.process.start()
+        child_conn.close()
+        self.tasks = 0
+        self.healthy = True
+    
+    def parse(self, file_path, fast, timeout):
+        self.tasks += 1
+        try:
+            self.conn.send((file_path, fast))
+            # poll() also returns when the child dies and closes its end
+            ready = self.conn.poll(timeout)
+            if ready:
+                status, result = self.conn.recv()
+        except (EOFError, OSError):
+            self.healthy = False
+            self.process.join(1)
+            if self.process.exitcode == -getattr(signal, "SIGXCPU", 0):
+                raise ParseError(f"Parsing exceeded the {self.cpu_limit}s CPU limit")
+            raise ParseError(f"Parser process exited unexpectedly (exit code {self.process.exitcode})")
+        if not ready:
+            self.healthy = False
+            raise TimeoutError(f"Parsing timed out after {timeout}s")
+        if status != 'ok':
+            raise ParseError(result)
+        return result
+    
+    def stop(self):
+        if self.healthy and self.process.is_alive():
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+            self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+class ParserPool:
+    """Bounded pool of parser processes with per-document resource limits.
+    
+    Each document is parsed in a child process limited to ``cpu_limit``
+    seconds of CPU time and ``memory_limit_mb`` of address space, and is
+    abandoned after ``timeout`` seconds of wall-clock time. A child that
+    times out or dies is killed and replaced, and healthy children are
+    recycled after ``max_tasks_per_child`` documents so leaks can't build up.
+    """
+    
+    def __init__(self, processes=2, timeout=60, cpu_limit=30, memory_limit_mb=2048,
+                 max_tasks_per_child=50, fast=False):
+        self.processes = processes
+        self.timeout = timeout
+        self.cpu_limit = cpu_limit
+        self.memory_limit_mb = memory_limit_mb
+        self.max_tasks_per_child = max_tasks_per_child
+        # Pipeline the children load up front; documents may still ask for the other
+        self.fast = fast
+        # Spawned rather than forked: the web process is multi-threaded
+        self._context = multiprocessing.get_context("spawn")
+        self._slots = threading.BoundedSemaphore(processes)
+        self._lock = threading.Lock()
+        self._idle = []
+        self._closed = False
+        self.started = 0
+        self.recycled = 0
+        self.timeouts = 0
+        self.crashes = 0
+    
+    def _acquire(self):
+        self._slots.acquire()
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        try:
+            worker = _ParserProcess(self._context, self.cpu_limit, self.memory_limit_mb, self.fast)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.started += 1
+        return worker
+    
+    def _release(self, worker):
+        with self._lock:
+            keep = (worker.healthy and not self._closed
+                    and (not self.max_tasks_per_child or worker.tasks < self.max_tasks_per_child))
+            if keep:
+                self._idle.append(worker)
+            elif worker.healthy:
+                self.recycled += 1
+        if not keep:
+            worker.stop()
+        self._slots.release()
+    
+    def parse(self, file_path, fast=False):
+        """Parse a resume file in a child process, raising on failure or timeout"""
+        worker = self._acquire()
+        try:
+            return worker.parse(file_path, fast, self.timeout)
+        except TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise
+        except ParseError:
+            if not worker.healthy:
+                with self._lock:
+                    self.crashes += 1
+            raise
+        finally:
+            self._release(worker)
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'processes': self.processes,
+                'idle_processes': len(self._idle),
+                'processes_started': self.started,
+                'processes_recycled': self.recycled,
+                'timeouts': self.timeouts,
+                'crashes': self.crashes,
+            }
+    
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+class ParseQueue:
+    """Local background queue that parses and vectorizes uploaded resumes.
+    
+    Jobs run on a small thread pool inside the web process, so no external
+    broker is needed. Each resume carries a ``status`` field ('processing',
+    'ready' or 'failed') that the applicant dashboard polls. With
+    ``PARSE_ISOLATION`` on, the threads hand text extraction and spaCy off
+    to a ``ParserPool``, so one bad file can't take down a web worker.
+    Jobs lost to a restart are picked up again by ``recover()``.
+    """
+    
+    def __init__(self, app=None):
+        self.max_workers = 2
+        self.isolation = True
+        self.stale_after = 600
+        self.cache_ttl = 30 * 24 * 3600
+        self.pool_options = {}
+        self._executor = None
+        self._pool = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self._indexes_checked = False
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.max_workers = app.config.get("PARSE_WORKERS", 2)
+        self.isolation = app.config.get("PARSE_ISOLATION", True)
+        self.stale_after = app.config.get("PARSE_STALE_AFTER", 600)
+        self.cache_ttl = app.config.get("PARSE_CACHE_TTL", 30 * 24 * 3600)
+        self.pool_options = {
+            'timeout': app.config.get("PARSE_TIMEOUT", 60),
+            'cpu_limit': app.config.get("PARSE_CPU_LIMIT", 30),
+            'memory_limit_mb': app.config.get("PARSE_MEMORY_LIMIT_MB", 2048),
+            'max_tasks_per_child': app.config.get("PARSE_MAX_TASKS_PER_CHILD", 50),
+            'fast': app.config.get("PARSER_FAST_MODE", False),
+        }
+        app.extensions["parse_queue"] = self
+    
+    @property
+    def pending(self):
+        """Number of queued or running parse jobs"""
+        return self._pending
+    
+    def stats(self):
+        with self._lock:
+            stats = {
+                'workers': self.max_workers,
+                'isolation': self.isolation,
+                'queued': self._pending - self._in_flight,
+                'in_flight': self._in_flight,
+                'completed': self.completed,
+                'failed': self.failed,
+            }
+            pool = self._pool
+        if pool is not None:
+            stats['pool'] = pool.stats()
+        return stats
+    
+    def _get_executor(self):
+        # Created lazily so forked web workers each get their own threads
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="resume-parser"
+                )
+            return self._executor
+    
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ParserPool(processes=self.max_workers, **self.pool_options)
+            return self._pool
+    
+    def parse(self, file_path, fast=False):
+        """Parse a resume file, in the isolated parser pool when enabled"""
+        if self.isolation:
+            return self._get_pool().parse(file_path, fast=fast)
+        
+        from app.nlp.parser import parse_resume
+        return parse_resume(file_path, fast=fast)
+    
+    def submit(self, app, resume_id, file_path, content_hash=None):
+        """Queue a stored resume file for parsing"""
+        with self._lock:
+            self._pending += 1
+        return self._get_executor().submit(self._run, app, resume_id, file_path, content_hash)
+    
+    def recover(self, app, resume):
+        """Requeue a resume whose parse job was lost, e.g. to a restart or deploy.
+        
+        A resume still 'processing' ``stale_after`` seconds after it was queued
+        is claimed by one process and parsed again from its stored upload, or
+        marked failed when that file is gone. Returns whether it was recovered.
+        """
+        from app.files import content_path
+        from app.models.resume import Resume
+        
+        stale_before = datetime.datetime.now() - datetime.timedelta(seconds=self.stale_after)
+        if resume.status != 'processing' or resume.updated_at is None or resume.updated_at >= stale_before:
+            return False
+        if not Resume.claim_stale(resume.id, stale_before):
+            return False
+        
+        file_path = None
+        if resume.content_hash and resume.filename:
+            extension = os.path.splitext(resume.filename)[1]
+            file_path = content_path(app.config['UPLOAD_FOLDER'], resume.content_hash, extension)
+        if file_path is None or not os.path.exists(file_path):
+            resume.status = 'failed'
+            resume.error = 'The uploaded file is no longer available. Please upload your resume again.'
+            resume.save()
+            return True
+        
+        app.logger.warning("Requeueing resume %s, processing since %s", resume.id, resume.updated_at)
+        self.submit(app, resume.id, file_path, resume.content_hash)
+        return True
+    
+    def recover_stale(self, app):
+        """Recover every stale 'processing' resume, returning how many were recovered"""
+        from app.models.resume import Resume
+        
+        stale_before = datetime.datetime.now() - datetime.timedelta(seconds=self.stale_after)
+        stale = Resume.find_stale(stale_before, {'vector': 0, 'parsed_data': 0})
+        return sum(self.recover(app, resume) for resume in stale)
+    
+    def _run(self, app, resume_id, file_path, content_hash=None):
+        from app.models.parse_cache import ParseCache
+        from app.models.resume import Resume
+        from app.nlp.parser import parser_version
+        from app.nlp.vectorizer import get_vectorizer
+        
+        with self._lock:
+            self._in_flight += 1
+        try:
+            with app.app_context():
+                resume = Resume.get_by_id(resume_id, {'vector': 0, 'parsed_data': 0})
+                if resume is None:
+                    return
+                if not self._indexes_checked:
+                    ParseCache.ensure_indexes(self.cache_ttl)
+                    self._indexes_checked = True
+                try:
+                    fast = app.config.get("PARSER_FAST_MODE", False)
+                    version = parser_version(fast)
+                    vectorizer = get_vectorizer()
+                    
+                    # Content seen before skips extraction, spaCy and, while the
+                    # vector model is unchanged, vectorization as well
+                    cached = ParseCache.get(content_hash, version) if content_hash else None
+                    if cached is not None:
+                        parsed_data, vector, vector_model = cached
+                    else:
+                        parsed_data = self.parse(file_path, fast=fast)
+                        vector = vector_model = None
+                    
+                    if vector is None or vector_model != vectorizer.model_version:
+                        vector, vector_model = vectorizer.vectorize(parsed_data)
+                        if content_hash:
+                            ParseCache.set(content_hash, version, parsed_data, vector, vector_model)
+                    
+                    resume.parsed_data = parsed_data
+                    resume.vector = vector
+                    resume.vector_model = vector_model
+                    resume.status = 'ready'
+                    resume.error = None
+                except Exception as e:
+                    app.logger.exception("Failed to parse resume %s", resume_id)
+                    resume.status = 'failed'
+                    resume.error = str(e)
+                # A re-upload while this job ran replaced the file; its own job owns the result
+                if resume.save(only_if={'content_hash': content_hash} if content_hash else None) is None:
+                    app.logger.info("Resume %s was re-uploaded while parsing, discarding the result", resume_id)
+                    return
+                with self._lock:
+                    if resume.status == 'ready':
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._in_flight -= 1
+    
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            pool, self._pool = self._pool, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+        if pool is not None:
+            pool.close()